@@ -0,0 +1,63 @@
+"""Startup-time budget for the command line interface.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, reports
+the slowest imports and fails if the total import time exceeds the budget or if
+a heavy backend (pygame, OpenCV) is imported before a backend is selected.
+
+Usage: python benchmarks/startup.py [--budget-ms 250] [--module cellularautomata.cli]
+"""
+import argparse
+import subprocess
+import sys
+
+FORBIDDEN = ("pygame", "cv2")
+"""Modules that should only be imported once their backend is selected."""
+
+
+def import_times(module):
+    """Return [(cumulative_us, self_us, name)] for every module imported by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative_us), int(self_us), name.strip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="cellularautomata.cli")
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_ms = sum(self_us for _, self_us, _ in times) / 1000
+    print(f"Importing {args.module}: {total_ms:.1f} ms over {len(times)} modules (budget {args.budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, name in sorted(times, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+
+    imported = {name.split(".")[0] for _, _, name in times}
+    heavy = [name for name in FORBIDDEN if name in imported]
+    failed = False
+    if heavy:
+        print(f"FAIL: {args.module} imports heavy backend modules {heavy}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Lazily loaded render, display and recording backends.
+
+Backends are registered as "module:attribute" strings and only imported when
+selected, so a headless run never pays for pygame or OpenCV. Every backend is a
+game-like class taking (width, height, cell_size, rules, fps, run_seconds, ca)
+with a `run()` method; backends that write files list them in `output_files`.
+"""
+import importlib
+
+BACKENDS = {
+    "window": "cellularautomata.game:Game",
+    "mp4": "cellularautomata.game:GameMP4",
+    "record": "cellularautomata.record:GameRecorder",
+    "png": "cellularautomata.indexed:GamePNG",
+    "apng": "cellularautomata.indexed:GameAPNG",
+    "gif": "cellularautomata.indexed:GameGIF",
+}
+
+INDEXED_BACKENDS = ("png", "apng", "gif")
+"""Backends that write palette-indexed frames at grid resolution and accept a `scale`."""
+
+
+def load_backend(name):
+    """Import and return the backend class registered under `name`."""
+    try:
+        target = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"backend {name} not recognized, expected one of {list(BACKENDS)}") from None
+    module_name, attr = target.split(":")
+    return getattr(importlib.import_module(module_name), attr)
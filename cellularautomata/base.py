@@ -11,6 +11,8 @@ class CellularAutomata:
         self.rules = rules
 
     def update(self):
+        # one ghost cell on every side wraps the edges, so neighbors are plain slices
+        self.padded = np.pad(self.grid, 1, mode="wrap")
         new_grid = self.grid.copy()
         for i in range(self.rows):
             for j in range(self.cols):
@@ -20,14 +22,7 @@ class CellularAutomata:
         self.grid = new_grid
 
     def count_alive_neighbors(self, x, y):
-        sum = 0
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                nx, ny = (x + i) % self.rows, (y + j) % self.cols
-                sum += self.grid[nx][ny]
-        return sum
+        return self.padded[x:x + 3, y:y + 3].sum() - self.grid[x][y]
 
 class Renderer:
     def __init__(self, cell_size=10):
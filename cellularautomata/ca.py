@@ -1,12 +1,68 @@
 from functools import partial
 import numpy as np
 
+from cellularautomata.neighborhood import BOUNDARIES, fill_ghosts
+from cellularautomata.shared import SharedArray, worker_context
+
+
+def apply_gathered(rules, padded: np.ndarray, table: np.ndarray, start=0, stop=None, rand=None):
+    """Next states of the raveled cells start:stop of a padded grid, gathering their
+    neighborhoods with the flat index `table` of `rules.neighborhood.index_table`.
+    `rand` is the grid's `rules.random_field`, for rules that draw random numbers.
+    Returns None if the rules only support the per-cell `apply` path."""
+    r = rules.neighborhood.radius
+    cols = padded.shape[1] - 2 * r
+    flat = padded.ravel()
+    i, j = np.divmod(np.arange(start, len(table) if stop is None else stop), cols)
+    states = np.take(flat, (i + r) * padded.shape[1] + j + r)
+    neighborhoods = np.take(flat, table[start:stop])
+    if rand is not None:
+        return rules.apply_gathered(states, neighborhoods, rand[start:stop])
+    return rules.apply_gathered(states, neighborhoods)
+
+
+_worker_rules = None
+"""The rules of a CellularAutomataMP worker, sent once so their caches stay warm between generations."""
+
+
+def init_worker(rules):
+    global _worker_rules
+    _worker_rules = rules
+
+
+def apply_shared_chunk(padded: SharedArray, table: SharedArray, start, stop, rand: SharedArray = None):
+    return apply_gathered(_worker_rules, padded.array, table.array, start, stop, None if rand is None else rand.array)
+
+
 class CellularAutomata:
-    def __init__(self, rows, cols, rules, init_mode="gradient-diag2"):
+    """Steps a grid of cells with `rules`.
+
+    The grid is stored with `rules.neighborhood.radius` ghost cells on every
+    side (`padded`), refreshed once per generation according to `boundary`:
+    "toroidal" wraps around, "fixed" holds the edge at `boundary_value`,
+    "reflective" mirrors the edge cells and "absorbing" holds the edge at 0.
+    `grid` is a view of the cells inside the ghost border. `update` writes each
+    generation into a second padded buffer and swaps the two, so a view of a
+    generation stays valid while the next one is computed.
+
+    Observer hooks registered with `add_observer` are called after each
+    generation is computed; with none registered `update` does no extra work."""
+
+    def __init__(self, rows, cols, rules, init_mode="gradient-diag2", boundary="toroidal", boundary_value=0):
+        if boundary not in BOUNDARIES:
+            raise ValueError(f"boundary {boundary} not recognized, expected one of {list(BOUNDARIES)}")
+        if boundary == "fixed" and boundary_value not in rules.possible_states:
+            raise ValueError(f"boundary_value {boundary_value} is not one of the states of {rules!r}")
         self.rows = rows
         self.cols = cols
         self.rules = rules
         self.seed = self.rules.seed
+        self.boundary = boundary
+        self.boundary_value = boundary_value
+        self.radius = self.rules.neighborhood.radius
+        self.generation = 0
+        self.observers = []
+        self.gathered = True  # until the rules turn out not to support apply_gathered
         # seed the grid
         if init_mode == "random":
             self.seed_random_grid()
@@ -27,6 +83,104 @@ class CellularAutomata:
         else:
             raise ValueError(f"init_mode {init_mode} not recognized")
 
+    @property
+    def grid(self) -> np.ndarray:
+        r = self.radius
+        return self.padded[r:r + self.rows, r:r + self.cols]
+
+    @grid.setter
+    def grid(self, grid: np.ndarray):
+        # a new buffer, so references to the previous generation's grid keep their contents
+        r = self.radius
+        self.padded = np.empty((self.rows + 2 * r, self.cols + 2 * r), dtype=grid.dtype)
+        self.padded[r:r + self.rows, r:r + self.cols] = grid
+        self.back = None
+
+    def swap(self, new_grid: np.ndarray):
+        """Write the next generation into the back buffer and make it the current one."""
+        if new_grid.dtype != self.padded.dtype:
+            self.grid = new_grid
+            return
+        if self.back is None:
+            self.back = np.empty_like(self.padded)
+        r = self.radius
+        self.back[r:r + self.rows, r:r + self.cols] = new_grid
+        self.padded, self.back = self.back, self.padded
+
+    def commit(self, new_grid: np.ndarray) -> bool:
+        """Advance to `new_grid`. Returns False, keeping the grid, if it did not change."""
+        self.generation += 1
+        if self.observers:
+            self.notify_observers(self.grid, new_grid)
+        # check if the grid has changed
+        if not np.array_equal(new_grid, self.grid):
+            self.swap(new_grid)
+            return True
+        # if the grid has not changed, stop the simulation
+        else:
+            return False
+
+    def iter_generations(self, n=None, every=1):
+        """Run the simulation, yielding a read-only view of the current grid and then
+        of every `every`-th generation.
+
+        Runs for `n` generations, or forever if n is None, and stops early at a
+        fixed point, yielding the final grid if it was not the last one yielded.
+        Engines that advance several generations per update (the distributed
+        engine's `decimation`) yield at most once per update, so to get a number
+        of frames rather than generations use itertools.islice. Nothing is
+        copied: a view shows its generation until the one after the next is
+        computed (the buffers are swapped), so copy it to keep it longer."""
+        if every < 1:
+            raise ValueError(f"every must be at least 1, got {every}")
+        start = last_yielded = self.generation
+        yield self.view()
+        while n is None or self.generation - start < n:
+            before, padded = self.generation, self.padded
+            running = self.update()
+            # at a fixed point the grid is only new if it was not yielded before the update
+            # or if the engine replaced it (the distributed engine gathers several generations at once)
+            if running and (self.generation - start) % every == 0 or \
+                    not running and (last_yielded < before or self.padded is not padded):
+                last_yielded = self.generation
+                yield self.view()
+            if not running:
+                return
+
+    def view(self) -> np.ndarray:
+        """A read-only view of the grid."""
+        view = self.grid
+        view.flags.writeable = False
+        return view
+
+    def add_observer(self, hook, every=1):
+        """Call `hook(generation, old_grid, new_grid, changed)` after every `every`-th generation.
+
+        `changed` is a boolean mask of the cells that differ between the two grids.
+        The grids must not be modified. Returns the hook."""
+        if every < 1:
+            raise ValueError(f"every must be at least 1, got {every}")
+        self.observers.append([hook, every, self.generation + every])
+        return hook
+
+    def remove_observer(self, hook):
+        self.observers = [observer for observer in self.observers if observer[0] is not hook]
+
+    def notify_observers(self, old_grid: np.ndarray, new_grid: np.ndarray):
+        """Call the observers that are due at the current generation."""
+        due = [observer for observer in self.observers if observer[2] <= self.generation]
+        if not due:
+            return
+        changed = old_grid != new_grid
+        for observer in due:
+            hook, every, _ = observer
+            hook(self.generation, old_grid, new_grid, changed)
+            observer[2] = self.generation + every
+
+    def fill_ghosts(self):
+        """Refresh the ghost cells from the grid according to the boundary condition."""
+        fill_ghosts(self.padded, self.radius, self.boundary, self.boundary_value)
+
     def seed_random_grid(self):
         np.random.seed(self.seed)
         self.grid = np.random.choice(self.rules.possible_states, size=(self.rows, self.cols))
@@ -51,20 +205,32 @@ class CellularAutomata:
                     self.grid[i, j] = int((self.rows - i + self.cols - j) / (self.rows + self.cols) * self.rules.num_states)
 
     def update(self):
-        new_grid = self.grid.copy()
-        for i in range(self.rows):
-            for j in range(self.cols):
-                new_grid[i, j] = self.rules.apply(self.grid, (i, j))
-        # check if the grid has changed
-        if not np.array_equal(new_grid, self.grid):
-            self.grid = new_grid
-            return True
-        # if the grid has not changed, stop the simulation
-        else:
-            return False
+        self.fill_ghosts()
+        # rules that can compute the whole grid at once skip the per-cell loop
+        new_grid = self.rules.step(self.padded)
+        if new_grid is None:
+            new_grid = self.step_gathered()
+        if new_grid is None:
+            new_grid = self.grid.copy()
+            r = self.radius
+            for i in range(self.rows):
+                for j in range(self.cols):
+                    new_grid[i, j] = self.rules.apply(self.padded, (i + r, j + r))
+        return self.commit(new_grid)
+
+    def step_gathered(self):
+        """Apply the rules to every cell at once from neighborhoods gathered with the
+        neighborhood's index table. Returns None if the rules do not support it."""
+        if not self.gathered:
+            return None
+        table = self.rules.neighborhood.index_table(self.rows, self.cols)
+        new_states = apply_gathered(self.rules, self.padded, table.array)
+        if new_states is None:
+            self.gathered = False
+            return None
+        return np.asarray(new_states, dtype=self.grid.dtype).reshape(self.rows, self.cols)
 
 
-from multiprocessing import Pool
 import itertools
 import os
 
@@ -72,24 +238,62 @@ class CellularAutomataMP(CellularAutomata):
 
     def __init__(self, *args, processes=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.positions = list(itertools.product(range(self.rows), range(self.cols)))
+        r = self.radius
+        self.positions = list(itertools.product(range(r, r + self.rows), range(r, r + self.cols)))
         if not processes:
-            processes = os.cpu_count() - 1  # leave one core for the OS and other processes
-        self.pool = Pool(processes=processes)
+            processes = max(1, os.cpu_count() - 1)  # leave one core for the OS and other processes
+        self.pool = worker_context().Pool(processes=processes, initializer=init_worker, initargs=(self.rules,))
+        # workers attach to the grid and the index table instead of receiving copies every generation
+        self.table = self.rules.neighborhood.index_table(self.rows, self.cols)
+        self.shared_padded = SharedArray(self.padded.shape, self.padded.dtype)
+        self.shared_rand = None
+        self.bounds = np.linspace(0, self.rows * self.cols, processes * 4 + 1).astype(int)
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.shared_padded.unlink()
+        if self.shared_rand is not None:
+            self.shared_rand.unlink()
+        # the table's block is unlinked once no other engine of this shape holds it
+        self.rules.neighborhood.drop_index_table(self.rows, self.cols)
+        self.table = None
+
+    def step_gathered(self):
+        """Apply the rules to chunks of cells in the worker processes."""
+        if not self.gathered:
+            return None
+        self.shared_padded.array[...] = self.padded
+        # random numbers are drawn here, so the workers' copies of the rules do not all draw the same ones
+        rand = self.rules.random_field(self.rows * self.cols)
+        if rand is not None:
+            if self.shared_rand is None:
+                self.shared_rand = SharedArray(rand.shape, rand.dtype)
+            self.shared_rand.array[...] = rand
+        chunks = [(self.shared_padded, self.table, start, stop, None if rand is None else self.shared_rand)
+                  for start, stop in zip(self.bounds[:-1], self.bounds[1:])]
+        results = self.pool.starmap(apply_shared_chunk, chunks)
+        if any(result is None for result in results):
+            self.gathered = False
+            return None
+        return np.concatenate(results).astype(self.grid.dtype).reshape(self.rows, self.cols)
 
     def update(self):
         """Use multiprocessing.Pool to create the new grid."""
-        new_grid = self.grid.copy()
-        apply = partial(self.rules.apply, self.grid)
-        new_grid = np.array(self.pool.map(apply, self.positions)).reshape(self.rows, self.cols)
-        # check if the grid has changed
-        if not np.array_equal(new_grid, self.grid):
-            self.grid = new_grid
-            return True
-        # if the grid has not changed, stop the simulation
-        else:
-            return False
+        self.fill_ghosts()
+        new_grid = self.rules.step(self.padded)
+        if new_grid is None:
+            new_grid = self.step_gathered()
+        if new_grid is None:
+            apply = partial(self.rules.apply, self.padded)
+            new_grid = np.array(self.pool.map(apply, self.positions)).reshape(self.rows, self.cols)
+        return self.commit(new_grid)
         
 
 if __name__ == "__main__":
@@ -115,5 +319,6 @@ if __name__ == "__main__":
     time_elapsed2 = time.time() - start
     print("MP:", time_elapsed2)
     print(f"MP is {time_elapsed / time_elapsed2:.2f} times faster")
+    ca2.close()
 
     assert np.array_equal(ca.grid, ca2.grid), "Grids are not equal"
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""Bounded memoization caches owned by rule instances.
+
+Unlike `functools.lru_cache` on a static method, these caches belong to a
+single rule instance, are bounded by entry count and optionally by estimated
+memory, can be cleared between runs and report hit/miss/memory statistics.
+They are pickled empty, so sending rules to worker processes does not ship
+their cache contents along.
+"""
+import functools
+import sys
+from collections import OrderedDict
+import numpy as np
+
+
+def sizeof(obj) -> int:
+    """Rough memory footprint of a cached key or value in bytes."""
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (0 if obj.base is None else obj.nbytes)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        return sys.getsizeof(obj) + sum(sizeof(item) for item in obj)
+    return sys.getsizeof(obj)
+
+
+class RuleCache:
+    """Least-recently-used cache bounded by `maxsize` entries and, if set, `maxbytes`."""
+
+    def __init__(self, name="", maxsize=2**16, maxbytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.clear()
+
+    def __repr__(self):
+        return f"RuleCache(name={self.name!r}, entries={len(self.entries)}, maxsize={self.maxsize}, maxbytes={self.maxbytes})"
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        return {"name": self.name, "maxsize": self.maxsize, "maxbytes": self.maxbytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute, *args):
+        """Return the cached value for `key`, calling compute(*args) on a miss."""
+        try:
+            value, _ = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute(*args)
+        if self.maxsize == 0:
+            return value
+        size = sizeof(key) + sizeof(value)
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while self.entries and (
+            (self.maxsize is not None and len(self.entries) > self.maxsize)
+            or (self.maxbytes is not None and self.nbytes > self.maxbytes)
+        ):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RuleCaches:
+    """Named RuleCaches sharing the same limits, created on first use."""
+
+    def __init__(self, maxsize=2**16, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.caches = {}
+
+    def __getitem__(self, name) -> RuleCache:
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches[name] = RuleCache(name, self.maxsize, self.maxbytes)
+        return cache
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    def stats(self) -> dict:
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(cache.nbytes for cache in self.caches.values())
+
+
+def cached(name):
+    """Memoize a method in `self.caches[name]`, keyed on its positional arguments."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            return self.caches[name].get(args, method, self, *args)
+        return wrapper
+    return decorator
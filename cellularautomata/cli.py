@@ -10,24 +10,38 @@ Has options for:
 "fps": fps,
 "run_seconds": run_seconds,
 "output_to_video": output_to_video,
+"backend": backend,
+"scale": scale,
 # RainbowLife2 only
-"equality_threshold": equality_threshold"""
+"equality_threshold": equality_threshold
+# LargerThanLife only
+"radius": radius,
+"neighborhood": neighborhood,
+"boundary": boundary,
+"boundary_value": boundary_value,
+"metrics": metrics,
+"metrics_every": metrics_every,
+"metric": metric"""
 
 import json
 import time
 import click
 import random
-from cellularautomata.game import GameMP4, Game
+from cellularautomata.backends import BACKENDS, INDEXED_BACKENDS, load_backend
 from cellularautomata.ca import CellularAutomata, CellularAutomataMP
-from cellularautomata.rules2 import RainbowLife2, RainbowLife, RainbowLife3
+from cellularautomata.neighborhood import BOUNDARIES, NEIGHBORHOODS
+from cellularautomata.rules2 import LargerThanLife, RainbowLife2, RainbowLife, RainbowLife3
 
 
 RULES = {
     "RainbowLife": RainbowLife,
     "RainbowLife2": RainbowLife2,
     "RainbowLife3": RainbowLife3,
+    "LargerThanLife": LargerThanLife,
 }
 
+INIT_MODES = ["random", "solid", "gradient-diag1", "gradient-diag2", "gradient-vert", "gradient-horiz"]
+
 
 def runner(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds, output_to_video, equality_threshold):
     """Run a cellular automata game."""
@@ -39,7 +53,7 @@ def runner(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds
         equality_threshold=equality_threshold
     )
     if output_to_video:
-        game = GameMP4(
+        game = load_backend("mp4")(
             width=width, 
             height=height, 
             cell_size=cell_size, 
@@ -48,7 +62,7 @@ def runner(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds
             run_seconds=run_seconds
         )
     else:
-        game = Game(
+        game = load_backend("window")(
             width=width, 
             height=height, 
             cell_size=cell_size, 
@@ -63,24 +77,34 @@ def runner(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds
 def output(game, ruleset, seed, width, height, cell_size, num_states, fps, run_seconds, equality_threshold):
     """Pop up a little save y/n dialog box."""
     import os
+    import shutil
     
     if not click.confirm("Save video?"):
         click.echo("Not saving video.")
-        os.remove("output.mp4")
+        for output_file in game.output_files:
+            # the png backend writes a directory of frames
+            if os.path.isdir(output_file):
+                shutil.rmtree(output_file)
+            else:
+                os.remove(output_file)
         return
     
     # generate a filename from configuration and rules class name
     rules_name = game.ca.rules.__class__.__name__
-    filename = f"videos/{rules_name}_{seed}_{width}x{height}_{cell_size}_{num_states}_{fps}_{run_seconds}_{equality_threshold}_{time.time()}.mp4"
+    stem = f"videos/{rules_name}_{seed}_{width}x{height}_{cell_size}_{num_states}_{fps}_{run_seconds}_{equality_threshold}_{time.time()}"
     # create videos directory if it doesn't exist
     os.makedirs("videos", exist_ok=True)
-    os.rename("output.mp4", filename)
+    for output_file in game.output_files:
+        os.rename(output_file, stem + os.path.splitext(output_file)[1])
+    filename = stem + os.path.splitext(game.output_files[0])[1]
     click.echo(f"Saved to {filename}")
     summary(RULES[ruleset], filename, seed=seed, width=width, height=height, cell_size=cell_size, num_states=num_states, fps=fps, run_seconds=run_seconds, equality_threshold=equality_threshold)
 
 
 def summary(rules, filename, **kwargs):
     """Print a summary of the game."""
+    import os
+
     summary = f"""{str(rules)}
 
 Configuration dict:
@@ -89,14 +113,26 @@ Configuration dict:
 Video saved as {filename}
 """
     click.echo(summary)
-    summary_filename = filename.replace(".mp4", ".txt")
+    summary_filename = os.path.splitext(filename)[0] + ".txt"
     with open(summary_filename, "w") as f:
         f.write(summary)   
 
 
+def parse_metrics(specs, default_every) -> dict:
+    """Metric name to interval from NAME[:EVERY] specs."""
+    intervals = {}
+    for spec in specs:
+        name, _, every = spec.partition(":")
+        try:
+            intervals[name] = int(every) if every else default_every
+        except ValueError:
+            raise click.BadParameter(f"{spec} is not NAME or NAME:EVERY", param_hint="--metric") from None
+    return intervals
+
+
 @click.command()
 @click.option("--ruleset", type=click.Choice(RULES.keys()), default="RainbowLife2", show_default=True)
-@click.option("--seed", type=int, default=random.randint(0, 1000000))
+@click.option("--seed", type=int, default=None, help="Random by default.")
 @click.option("--width", type=int, default=1000, show_default=True)
 @click.option("--height", type=int, default=1000, show_default=True)
 @click.option("--cell_size", type=int, default=20, show_default=True)
@@ -106,34 +142,83 @@ Video saved as {filename}
 # boolean flags
 @click.option("--output_to_video", is_flag=True, default=True, show_default=True)
 @click.option("--use_mp", is_flag=True, default=False, show_default=True)
+@click.option("--workers", type=int, default=0, show_default=True,
+              help="Split the grid across this many local worker processes with halo exchange.")
+@click.option("--decimation", type=int, default=1, show_default=True,
+              help="Generations per rendered frame when using --workers.")
+@click.option("--backend", type=click.Choice(BACKENDS.keys()), default=None,
+              help="Defaults to mp4 with --output_to_video, otherwise window. record only needs NumPy.")
+@click.option("--scale", type=int, default=1, show_default=True,
+              help="Pixels per cell for the png, apng and gif backends, which write at grid resolution.")
 # RainbowLife2 only
 @click.option("--equality_threshold", type=int, default=0, show_default=True)
-def main(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds, output_to_video, use_mp, equality_threshold):
+# LargerThanLife only
+@click.option("--radius", type=int, default=5, show_default=True)
+@click.option("--neighborhood", type=click.Choice(NEIGHBORHOODS.keys()), default="moore", show_default=True)
+@click.option("--init_mode", type=click.Choice(INIT_MODES), default="gradient-diag2", show_default=True)
+@click.option("--boundary", type=click.Choice(BOUNDARIES.keys()), default="toroidal", show_default=True,
+              help="What lies beyond the edges of the grid.")
+@click.option("--boundary_value", type=int, default=0, show_default=True,
+              help="State of the cells beyond the edges with --boundary fixed.")
+@click.option("--metrics", type=click.Path(dir_okay=False), default=None,
+              help="Write per-generation metrics (changed cells, state histogram, entropy, largest cluster) to this JSONL file.")
+@click.option("--metrics_every", type=int, default=1, show_default=True,
+              help="Generations between records of the metrics given without an interval.")
+@click.option("--metric", multiple=True, metavar="NAME[:EVERY]",
+              help="Record only this metric (changed, histogram, entropy or largest_cluster), every EVERY generations. "
+                   "Repeat for several metrics, all of them by default.")
+def main(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds, output_to_video, use_mp, workers, decimation, backend, scale, equality_threshold, radius, neighborhood, init_mode, boundary, boundary_value, metrics, metrics_every, metric):
     """Run a cellular automata game."""
+    if seed is None:
+        seed = random.randint(0, 1000000)
+    if backend is None:
+        backend = "mp4" if output_to_video else "window"
     rules = RULES[ruleset](
         seed=seed,
         num_states=num_states, 
         pastel=True, 
         scroll=False,
-        equality_threshold=equality_threshold
+        equality_threshold=equality_threshold,
+        radius=radius,
+        neighborhood=neighborhood
     )
-    if use_mp:
-        ca = CellularAutomataMP(width // cell_size, height // cell_size, rules)
+    if workers and boundary != "toroidal":
+        raise click.UsageError("--workers only supports the toroidal boundary")
+    engine_options = {"init_mode": init_mode, "boundary": boundary, "boundary_value": boundary_value}
+    if workers:
+        from cellularautomata.distributed import DistributedCellularAutomata
+
+        ca = DistributedCellularAutomata(width // cell_size, height // cell_size, rules, workers=workers,
+                                         decimation=decimation, **engine_options)
+    elif use_mp:
+        ca = CellularAutomataMP(width // cell_size, height // cell_size, rules, **engine_options)
     else:
-        ca = CellularAutomata(width // cell_size, height // cell_size, rules)
+        ca = CellularAutomata(width // cell_size, height // cell_size, rules, **engine_options)
+    metrics_logger = None
+    if metrics:
+        from cellularautomata.observers import METRICS, MetricsLogger
 
-    if output_to_video:
-        game = GameMP4(
+        intervals = parse_metrics(metric, metrics_every) if metric else dict.fromkeys(METRICS, metrics_every)
+        try:
+            metrics_logger = MetricsLogger(metrics, intervals, num_states=len(rules.possible_states))
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint="--metric") from None
+        ca.add_observer(metrics_logger, every=metrics_logger.every)
+
+    backend_options = {"scale": scale} if backend in INDEXED_BACKENDS else {}
+    if backend != "window":
+        game = load_backend(backend)(
             width=width, 
             height=height, 
             cell_size=cell_size, 
             rules=rules, 
             fps=fps, 
             run_seconds=run_seconds,
-            ca=ca
+            ca=ca,
+            **backend_options
         )
     else:
-        game = Game(
+        game = load_backend(backend)(
             width=width, 
             height=height, 
             cell_size=cell_size, 
@@ -141,8 +226,15 @@ def main(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds,
             fps=fps,
             ca=ca
         )
-    game.run()
-    if output_to_video:
+    try:
+        game.run()
+    finally:
+        if workers or use_mp:
+            ca.close()
+        if metrics_logger is not None:
+            metrics_logger.close()
+            click.echo(f"Metrics written to {metrics}")
+    if backend != "window":
         output(game, ruleset, seed, width, height, cell_size, num_states, fps, run_seconds, equality_threshold)
     else:
         click.echo("Not saving video.")
@@ -159,5 +251,94 @@ def main(ruleset, seed, width, height, cell_size, num_states, fps, run_seconds,
         click.echo("")
 
 
+@click.command()
+@click.option("--ruleset", type=click.Choice(RULES.keys()), default="RainbowLife2", show_default=True)
+@click.option("--seed", type=int, default=None, help="Random by default.")
+@click.option("--width", type=int, default=1000, show_default=True)
+@click.option("--height", type=int, default=1000, show_default=True)
+@click.option("--cell_size", type=int, default=20, show_default=True)
+@click.option("--num_states", type=int, default=50, show_default=True)
+@click.option("--equality_threshold", type=int, default=0, show_default=True)
+@click.option("--init_mode", type=click.Choice(INIT_MODES), default="gradient-diag2", show_default=True)
+@click.option("--fps", type=int, default=None, help="Limit the generation rate, unlimited by default.")
+@click.option("--generations", type=int, default=None, help="Stop after this many generations.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=None, help="Plain TCP port for FrameClient viewers, disabled by default.")
+@click.option("--http_port", type=int, default=8765, show_default=True, help="Browser viewer and WebSocket port.")
+@click.option("--max_queue", type=click.IntRange(min=1), default=8, show_default=True, help="Frames a viewer may lag before frames are dropped.")
+def serve(ruleset, seed, width, height, cell_size, num_states, equality_threshold, init_mode, fps, generations, host, port, http_port, max_queue):
+    """Run a cellular automata headless and stream it to remote viewers."""
+    import asyncio
+    from cellularautomata.stream import FrameServer
+
+    if seed is None:
+        seed = random.randint(0, 1000000)
+    rules = RULES[ruleset](
+        seed=seed,
+        num_states=num_states,
+        pastel=True,
+        scroll=False,
+        equality_threshold=equality_threshold
+    )
+    ca = CellularAutomata(width // cell_size, height // cell_size, rules, init_mode=init_mode)
+    server = FrameServer(ca, host=host, port=port, http_port=http_port, max_queue=max_queue, fps=fps)
+    if http_port is not None:
+        click.echo(f"Viewer at http://{host}:{http_port}/")
+    if port is not None:
+        click.echo(f"TCP stream at {host}:{port}")
+    click.echo(f"Seed: {seed}. Press Ctrl-C to stop.")
+    try:
+        asyncio.run(server.serve(generations, linger=True))
+    except KeyboardInterrupt:
+        click.echo(f"Stopped at generation {server.generation}.")
+
+
+@click.command()
+@click.option("--rule_number", type=click.IntRange(0, 255), default=110, show_default=True)
+@click.option("--width", type=int, default=1000, show_default=True)
+@click.option("--generations", type=int, default=1_000_000, show_default=True)
+@click.option("--init_mode", type=click.Choice(["single", "random"]), default="single", show_default=True)
+@click.option("--seed", type=int, default=None)
+@click.option("--output", type=click.Path(dir_okay=False), default="spacetime.npy", show_default=True,
+              help="A .npy file for the raw spacetime diagram or a .mp4 file for a scrolling video.")
+@click.option("--height", type=int, default=500, show_default=True, help="Generations visible per video frame.")
+@click.option("--cell_size", type=int, default=1, show_default=True)
+@click.option("--fps", type=int, default=30, show_default=True)
+@click.option("--rows_per_frame", type=int, default=1, show_default=True)
+def eca(rule_number, width, generations, init_mode, seed, output, height, cell_size, fps, rows_per_frame):
+    """Generate the spacetime diagram of an elementary cellular automaton."""
+    from cellularautomata.elementary import ElementaryEngine
+
+    engine = ElementaryEngine(width, rule_number, init_mode=init_mode, seed=seed)
+    if output.endswith(".mp4"):
+        engine.to_mp4(output, generations, height, cell_size=cell_size, fps=fps, rows_per_frame=rows_per_frame)
+    else:
+        engine.to_npy(output, generations)
+    click.echo(f"Rule {rule_number}: {generations} generations of width {width} saved to {output}")
+    click.echo(f"Throughput: {engine.throughput:,.0f} cell-updates/s")
+
+
+
+@click.command()
+@click.argument("recording", type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", type=click.Path(), default=None,
+              help="Defaults to the recording's name with the extension of the format.")
+@click.option("--format", "format_", type=click.Choice(["mp4", "apng", "gif", "png"]), default=None,
+              help="Inferred from --output (.mp4, .png, .gif or a directory for png), mp4 by default.")
+@click.option("--processes", type=int, default=None, help="Worker processes, one per core by default.")
+@click.option("--segments", type=int, default=None, help="Time segments to split the run into, one per process by default.")
+@click.option("--cell_size", type=int, default=None, help="Pixels per cell for mp4, the recorded cell size by default.")
+@click.option("--scale", type=int, default=1, show_default=True, help="Pixels per cell for apng, gif and png.")
+@click.option("--fps", type=int, default=None, help="The recorded fps by default.")
+def render(recording, output, format_, processes, segments, cell_size, scale, fps):
+    """Encode a run recorded with --backend record, in parallel segments."""
+    from cellularautomata.render import render as render_recording
+
+    start = time.time()
+    output = render_recording(recording, output, format=format_, processes=processes, segments=segments,
+                              cell_size=cell_size, scale=scale, fps=fps)
+    click.echo(f"Rendered {recording} to {output} in {time.time() - start:.2f}s")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""Persistent content-addressed cache of arrays built from rule parameters.
+
+Compiled lookup tables are saved as .npy files named after the sha256 of what
+they were built from (the kind of array, the rules class and its parameters),
+so every CLI run and sweep worker after the first one memory-maps them instead
+of rebuilding them.
+
+The cache lives in $CELLULARAUTOMATA_CACHE_DIR, or cellularautomata under
+$XDG_CACHE_HOME (~/.cache by default); setting CELLULARAUTOMATA_CACHE_DIR to an
+empty string disables it. Entries are stored under a directory named after
+CACHE_VERSION, which is bumped whenever the layout of the cached arrays or the
+way they are built changes; directories of other versions are removed. When
+the cache grows over $CELLULARAUTOMATA_CACHE_MAX_BYTES (1 GiB by default) the
+least recently used entries are evicted. The cache is only walked on the first
+save of a process and when the size it has kept count of goes over the limit.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 2**30
+
+
+def default_root():
+    root = os.environ.get("CELLULARAUTOMATA_CACHE_DIR")
+    if root is not None:
+        return root or None
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cellularautomata")
+
+
+class DiskCache:
+    """Arrays stored as memory-mapped .npy files under `root`. A cache with no root stores nothing."""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.directory = None if root is None else os.path.join(root, f"v{CACHE_VERSION}")
+        self.total = None  # bytes in the cache, counted by evict() and kept up to date by save()
+
+    def __repr__(self):
+        return f"DiskCache(directory={self.directory!r}, max_bytes={self.max_bytes})"
+
+    @staticmethod
+    def key(kind, **params) -> str:
+        """Content address of an array of `kind` built from `params` (JSON serializable values)."""
+        description = json.dumps({"version": CACHE_VERSION, "kind": kind, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key[:2], key + ".npy")
+
+    def load(self, key):
+        """The cached array, memory-mapped read-only, or None."""
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # the modification time orders entries for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return array
+
+    def save(self, key, array: np.ndarray):
+        if self.directory is None:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename, so concurrent workers never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError:
+            # a read-only or full disk only costs the speedup
+            return
+        if self.total is None:
+            self.evict()
+        else:
+            self.total += size
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def get(self, key, compute):
+        """The cached array for `key`, computing and storing it with compute() on a miss."""
+        array = self.load(key)
+        if array is None:
+            array = np.asarray(compute())
+            self.save(key, array)
+        return array
+
+    def entries(self) -> list:
+        """(mtime, size, path) of every cached file, least recently used first."""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove stale versions, then least recently used entries until the cache fits in `max_bytes`."""
+        for name in os.listdir(self.root):
+            if name.startswith("v") and name != f"v{CACHE_VERSION}":
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total = total
+
+    def clear(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.total = 0
+
+
+_default_caches = {}
+"""Caches returned by default_cache, by (root, max_bytes), so their size count lasts for the process."""
+
+
+def default_cache() -> DiskCache:
+    """The cache configured by the environment."""
+    root = default_root()
+    max_bytes = int(os.environ.get("CELLULARAUTOMATA_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    cache = _default_caches.get((root, max_bytes))
+    if cache is None:
+        cache = _default_caches[root, max_bytes] = DiskCache(root, max_bytes)
+    return cache
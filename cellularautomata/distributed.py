@@ -0,0 +1,220 @@
+"""Domain-decomposed simulation across processes and hosts.
+
+The toroidal grid is split into horizontal strips (full-width tiles), one per
+worker process. Every generation each worker swaps its top and bottom `r` rows
+with its neighbors over sockets (the halo, r being the neighborhood radius),
+steps its padded strip and keeps the interior rows. Columns wrap inside each
+strip, so the result is bit-identical to the single-process engine for any
+deterministic rules. Rules that draw random numbers per cell (RainbowLife)
+consume them in a different order and will not match; kernel rules give each
+strip its own random stream (`KernelRules.spawn`) rather than repeating one.
+
+A coordinator owns the workers: it hands out the strips, tells them how many
+generations to run and gathers the full grid every `decimation` generations.
+Workers started on other hosts connect to it with
+
+    python -m cellularautomata.distributed worker COORDINATOR_HOST:PORT
+
+Messages are length-prefixed pickles, so only run this on a trusted network.
+"""
+import pickle
+import socket
+import struct
+import sys
+import threading
+import numpy as np
+
+from cellularautomata.ca import CellularAutomata, apply_gathered
+from cellularautomata.shared import worker_context
+
+
+def send_message(sock: socket.socket, obj):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack("!Q", len(payload)) + payload)
+
+
+def recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    while n:
+        received = sock.recv_into(view[-n:], n)
+        if not received:
+            raise ConnectionError("connection closed")
+        n -= received
+    return bytes(buffer)
+
+
+def recv_message(sock: socket.socket):
+    (length,) = struct.unpack("!Q", recv_exactly(sock, 8))
+    return pickle.loads(recv_exactly(sock, length))
+
+
+def step_strip(rules, padded: np.ndarray, radius: int) -> np.ndarray:
+    """Next state of the interior rows of a strip padded with `radius` halo rows on each side."""
+    # columns wrap within the strip, which completes the ghost border
+    padded = np.pad(padded, ((0, 0), (radius, radius)), mode="wrap")
+    rows, cols = padded.shape[0] - 2 * radius, padded.shape[1] - 2 * radius
+    new = rules.step(padded)
+    if new is not None:
+        return new
+    table = rules.neighborhood.index_table(rows, cols).array
+    new = apply_gathered(rules, padded, table)
+    if new is not None:
+        return np.asarray(new, dtype=padded.dtype).reshape(rows, cols)
+    interior = np.empty((rows, cols), dtype=padded.dtype)
+    for i in range(rows):
+        for j in range(cols):
+            interior[i, j] = rules.apply(padded, (i + radius, j + radius))
+    return interior
+
+
+class Worker:
+    """Steps one strip of the grid and swaps halos with the strips above and below."""
+
+    def __init__(self, coordinator_address, advertise_host=None):
+        self.coordinator = socket.create_connection(coordinator_address)
+        # the address the coordinator reaches us on is the one our peers can use too
+        host = advertise_host or self.coordinator.getsockname()[0]
+        self.listener = socket.create_server(("", 0))
+        send_message(self.coordinator, ("hello", (host, self.listener.getsockname()[1])))
+
+    def run(self):
+        try:
+            _, config = recv_message(self.coordinator)
+            self.rules = config["rules"]
+            self.radius = config["radius"]
+            self.strip = config["strip"]
+            if hasattr(self.rules, "spawn"):
+                self.rules.spawn(config["index"])
+            # the kernel queues our connection to the next strip even before it accepts,
+            # so every worker can connect first and accept second without deadlocking
+            self.down = socket.create_connection(tuple(config["next_peer"]))
+            self.up, _ = self.listener.accept()
+            self.listener.close()
+            for sock in (self.coordinator, self.down, self.up):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            while True:
+                message = recv_message(self.coordinator)
+                if message[0] == "run":
+                    changed = [self.step() for _ in range(message[1])]
+                    send_message(self.coordinator, ("done", changed, self.strip))
+                elif message[0] == "stop":
+                    break
+        finally:
+            for sock in (self.coordinator, getattr(self, "down", None), getattr(self, "up", None)):
+                if sock is not None:
+                    sock.close()
+
+    def exchange_halos(self):
+        r = self.radius
+        if r == 0:
+            # the cells only depend on themselves
+            return self.strip[:0], self.strip[:0]
+        # send in the background so large halos cannot deadlock two workers sending to each other
+        sender = threading.Thread(
+            target=lambda: (send_message(self.down, self.strip[-r:]), send_message(self.up, self.strip[:r]))
+        )
+        sender.start()
+        top = recv_message(self.up)
+        bottom = recv_message(self.down)
+        sender.join()
+        return top, bottom
+
+    def step(self) -> bool:
+        top, bottom = self.exchange_halos()
+        padded = np.concatenate([top, self.strip, bottom])
+        new = step_strip(self.rules, padded, self.radius)
+        changed = not np.array_equal(new, self.strip)
+        self.strip = new
+        return changed
+
+
+def run_worker(coordinator_address, advertise_host=None):
+    Worker(coordinator_address, advertise_host).run()
+
+
+class DistributedCellularAutomata(CellularAutomata):
+    """CellularAutomata whose strips are stepped by worker processes.
+
+    `workers` local processes are started unless `spawn` is False, in which case
+    the coordinator waits for that many workers to connect on (host, port).
+    Each `update()` runs `decimation` generations on the workers and then gathers
+    the grid, so `grid` is only refreshed every `decimation` generations."""
+
+    def __init__(self, rows, cols, rules, workers=2, decimation=1, host="127.0.0.1", port=0, spawn=True,
+                 **kwargs):
+        if kwargs.get("boundary", "toroidal") != "toroidal":
+            raise ValueError("the distributed engine only supports toroidal boundaries")
+        super().__init__(rows, cols, rules, **kwargs)
+        if rows // workers < self.radius:
+            raise ValueError(f"{rows} rows cannot be split into {workers} strips of at least {self.radius} rows")
+        self.decimation = decimation
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.processes = []
+        if spawn:
+            for _ in range(workers):
+                process = worker_context().Process(target=run_worker, args=(self.address,), daemon=True)
+                process.start()
+                self.processes.append(process)
+        self.connections, peers = [], []
+        for _ in range(workers):
+            connection, _ = self.server.accept()
+            _, peer = recv_message(connection)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.append(connection)
+            peers.append(peer)
+
+        self.bounds = np.linspace(0, rows, workers + 1).astype(int)
+        for index, connection in enumerate(self.connections):
+            send_message(connection, ("init", {
+                "rules": rules,
+                "radius": self.radius,
+                "strip": self.grid[self.bounds[index]:self.bounds[index + 1]],
+                "index": index,
+                "next_peer": peers[(index + 1) % workers],
+            }))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self):
+        for connection in self.connections:
+            send_message(connection, ("run", self.decimation))
+        changed = np.zeros(self.decimation, dtype=bool)
+        strips = []
+        for connection in self.connections:
+            _, strip_changed, strip = recv_message(connection)
+            changed |= strip_changed
+            strips.append(strip)
+        new_grid = np.concatenate(strips)
+        self.generation += self.decimation
+        if self.observers:
+            self.notify_observers(self.grid, new_grid)
+        self.grid = new_grid
+        # a generation where no strip changed is a fixed point, every later one is identical
+        return bool(changed.all())
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                send_message(connection, ("stop",))
+            except OSError:
+                pass
+            connection.close()
+        self.connections = []
+        self.server.close()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+
+
+if __name__ == "__main__":
+    # the check against the single-process engine lives in tests/test_distributed.py
+    if sys.argv[1:2] != ["worker"] or len(sys.argv) < 3:
+        sys.exit("usage: python -m cellularautomata.distributed worker COORDINATOR_HOST:PORT [ADVERTISE_HOST]")
+    host, port = sys.argv[2].rsplit(":", 1)
+    run_worker((host, int(port)), advertise_host=sys.argv[3] if len(sys.argv) > 3 else None)
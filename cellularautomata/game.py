@@ -1,9 +1,9 @@
 import random
 import time
+from itertools import islice
 import pygame
 from cellularautomata.ca import CellularAutomata
 from cellularautomata.rules2 import RainbowLife, RainbowLife2
-import cv2
 import numpy as np
 
 # render to pygame window
@@ -20,9 +20,11 @@ class PygameRenderer:
         # draw the grid
         pygame.surfarray.blit_array(win, state_colors)
 
-# render to mp4 file using opencv
+# render to mp4 file using opencv, only imported by this backend
 class MP4Renderer(PygameRenderer):
     def __init__(self, cell_size, frame_size, fps):
+        import cv2
+
         self.fps = fps
         self.filename = "output.mp4"
         self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -30,6 +32,8 @@ class MP4Renderer(PygameRenderer):
         super().__init__(cell_size, frame_size[0]//cell_size, frame_size[1]//cell_size)
 
     def draw(self, win, ca):
+        import cv2
+
         frame = pygame.surfarray.array3d(win)
         frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
         self.out.write(frame)
@@ -41,7 +45,7 @@ class MP4Renderer(PygameRenderer):
 
 
 class Game:
-    def __init__(self, width=800, height=600, cell_size=10, rules=RainbowLife(), fps=10, ca=None):
+    def __init__(self, width=800, height=600, cell_size=10, rules=None, fps=10, ca=None):
         pygame.init()
         self.width = width
         self.height = height
@@ -51,20 +55,17 @@ class Game:
         pygame.display.set_caption("Cellular Automata")
         rows, cols = self.height // cell_size, self.width // cell_size
         if ca is None:
-            self.ca = CellularAutomata(rows, cols, rules)
+            # built here rather than as a default argument, so importing the module has no side effects
+            self.ca = CellularAutomata(rows, cols, rules if rules is not None else RainbowLife())
         else:
             self.ca = ca
         self.renderer = PygameRenderer(cell_size, rows, cols)
 
     def run(self):
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-            if not self.ca.update():
-                # if the grid has not changed, stop the simulation early to save time
-                running = False
+        # iter_generations stops by itself once the grid reaches a fixed point
+        for _ in self.ca.iter_generations():
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
             self.renderer.draw(self.screen, self.ca)
             pygame.display.flip()
             pygame.time.delay(1000 // self.fps)
@@ -76,6 +77,7 @@ class GameMP4(Game):
         super().__init__(*args, **kwargs)
         self.run_seconds = run_seconds
         self.renderer = MP4Renderer(self.cell_size, (self.width, self.height), self.fps)
+        self.output_files = [self.renderer.filename]
 
     def run(self):
         try:
@@ -85,26 +87,18 @@ class GameMP4(Game):
             pygame.quit()
         
     def _run(self):
-        running = True
         total_frames = self.run_seconds * self.fps
         print(f"Running for {self.run_seconds} seconds, {total_frames} frames")
-        while running and total_frames > 0:
-            running, total_frames = self._run_one(total_frames)
+        # count frames rather than generations, an update may advance several generations
+        for frames, _ in enumerate(islice(self.ca.iter_generations(), total_frames), start=1):
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+            self.renderer.draw(self.screen, self.ca)
+            pygame.display.flip()
+            pygame.time.delay(1000 // self.fps)
             # log the progress every 1% of the total frames
-            if total_frames % (self.fps * self.run_seconds // 100) == 0:
-                print(f"{total_frames / (self.fps * self.run_seconds) * 100:.0f}% done")
-
-    def _run_one(self, total_frames):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False, total_frames
-        if not self.ca.update():
-            return False, total_frames
-        self.renderer.draw(self.screen, self.ca)
-        pygame.display.flip()
-        pygame.time.delay(1000 // self.fps)
-        total_frames -= 1
-        return True, total_frames
+            if frames % max(total_frames // 100, 1) == 0:
+                print(f"{frames / total_frames * 100:.0f}% done")
 
 def main():
     rules = RainbowLife(num_states=10, pastel=False, scroll=False)
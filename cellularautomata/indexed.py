@@ -0,0 +1,293 @@
+"""Palette-indexed output at grid resolution: PNG sequences, GIF and APNG.
+
+A frame is the grid itself (one pixel per cell) and the rules' colors become the
+image palette, so frames are tiny and losslessly compressed instead of being
+upscaled to display resolution and smeared by a video codec. Upscaling is left
+to the viewer, or done per frame with an integer `scale`.
+
+Only NumPy and the standard library are needed. Each frame is encoded
+independently of the others (`encode_frame`), so segments of a run can be
+encoded separately and concatenated with `write_encoded`.
+"""
+import os
+import struct
+import zlib
+import numpy as np
+
+from cellularautomata.record import GameRecorder
+
+MAX_PALETTE_SIZE = 256
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def check_palette(palette) -> np.ndarray:
+    palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+    if len(palette) > MAX_PALETTE_SIZE:
+        raise ValueError(
+            f"indexed output supports at most {MAX_PALETTE_SIZE} states, got {len(palette)}; "
+            "use the mp4 or record backend instead"
+        )
+    return palette
+
+
+def upscale(frame: np.ndarray, scale: int) -> np.ndarray:
+    if scale == 1:
+        return frame
+    return frame.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def png_header(width, height, palette) -> bytes:
+    """Signature, IHDR (8-bit indexed color) and PLTE chunks."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return PNG_SIGNATURE + png_chunk(b"IHDR", ihdr) + png_chunk(b"PLTE", palette.tobytes())
+
+
+def png_image_data(frame: np.ndarray, level=6) -> bytes:
+    """Zlib stream of the frame's scanlines, each prefixed with filter type 0."""
+    rows = np.zeros((frame.shape[0], frame.shape[1] + 1), dtype=np.uint8)
+    rows[:, 1:] = frame
+    return zlib.compress(rows.tobytes(), level)
+
+
+def write_png(filename, frame: np.ndarray, palette):
+    """Write a single palette-indexed PNG."""
+    palette = check_palette(palette)
+    frame = np.asarray(frame, dtype=np.uint8)
+    with open(filename, "wb") as f:
+        f.write(png_header(frame.shape[1], frame.shape[0], palette))
+        f.write(png_chunk(b"IDAT", png_image_data(frame)))
+        f.write(png_chunk(b"IEND", b""))
+
+
+def lzw_encode(data: bytes, min_code_size: int) -> bytes:
+    """Variable-length-code LZW as used by GIF, with codes packed least significant bit first."""
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    out = bytearray()
+    bits = 0
+    num_bits = 0
+
+    def emit(code, size):
+        nonlocal bits, num_bits
+        bits |= code << num_bits
+        num_bits += size
+        while num_bits >= 8:
+            out.append(bits & 0xFF)
+            bits >>= 8
+            num_bits -= 8
+
+    def reset():
+        return {bytes([i]): i for i in range(clear_code)}, min_code_size + 1, end_code + 1
+
+    table, code_size, next_code = reset()
+    emit(clear_code, code_size)
+    prefix = b""
+    for byte in data:
+        candidate = prefix + bytes([byte])
+        if candidate in table:
+            prefix = candidate
+            continue
+        emit(table[prefix], code_size)
+        if next_code == 4096:
+            emit(clear_code, code_size)
+            table, code_size, next_code = reset()
+        else:
+            table[candidate] = next_code
+            # the decoder adds its entries one code later, so widen once the last code no longer fits
+            if next_code == 1 << code_size:
+                code_size += 1
+            next_code += 1
+        prefix = bytes([byte])
+    if prefix:
+        emit(table[prefix], code_size)
+    emit(end_code, code_size)
+    if num_bits:
+        out.append(bits & 0xFF)
+    return bytes(out)
+
+
+class IndexedWriter:
+    """Base for writers of palette-indexed frames.
+    With `filename` None the writer only encodes frames, e.g. in a worker process."""
+
+    def __init__(self, filename, palette, fps=30, scale=1):
+        self.filename = filename
+        self.palette = check_palette(palette)
+        self.fps = fps
+        self.scale = scale
+        self.frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def encode_frame(self, frame: np.ndarray) -> bytes:
+        raise NotImplementedError("This method should encode one frame independently of the others.")
+
+    def write_encoded(self, encoded: bytes, shape: tuple):
+        """Append a frame produced by `encode_frame`; `shape` is its (rows, cols) after scaling."""
+        raise NotImplementedError("This method should append an encoded frame to the output.")
+
+    def write(self, frame: np.ndarray):
+        frame = upscale(np.asarray(frame, dtype=np.uint8), self.scale)
+        self.write_encoded(self.encode_frame(frame), frame.shape)
+
+    def close(self):
+        pass
+
+
+class PNGSequenceWriter(IndexedWriter):
+    """One indexed PNG per frame in the `filename` directory."""
+
+    def __init__(self, filename, palette, fps=30, scale=1):
+        super().__init__(filename, palette, fps, scale)
+        if filename is not None:
+            # frames of an earlier run would be mixed in with this one's
+            if os.path.isdir(filename) and os.listdir(filename):
+                raise FileExistsError(f"{filename} already exists and is not empty")
+            os.makedirs(filename, exist_ok=True)
+
+    def encode_frame(self, frame):
+        return png_image_data(frame)
+
+    def write_encoded(self, encoded, shape):
+        path = os.path.join(self.filename, f"frame_{self.frames:06d}.png")
+        with open(path, "wb") as f:
+            f.write(png_header(shape[1], shape[0], self.palette))
+            f.write(png_chunk(b"IDAT", encoded))
+            f.write(png_chunk(b"IEND", b""))
+        self.frames += 1
+
+
+class APNGWriter(IndexedWriter):
+    """Animated PNG. The frame count in the acTL chunk is patched in on close."""
+
+    def __init__(self, filename, palette, fps=30, scale=1):
+        super().__init__(filename, palette, fps, scale)
+        self.file = None if filename is None else open(filename, "wb")
+        self.sequence = 0
+        self.actl_offset = None
+
+    def encode_frame(self, frame):
+        return png_image_data(frame)
+
+    def write_encoded(self, encoded, shape):
+        height, width = shape
+        if self.actl_offset is None:
+            self.file.write(png_header(width, height, self.palette))
+            self.actl_offset = self.file.tell()
+            self.file.write(png_chunk(b"acTL", struct.pack(">II", 0, 0)))
+        # sequence, size, offset, delay of 1 / fps seconds, dispose none, blend source
+        fctl = struct.pack(">IIIIIHHBB", self.sequence, width, height, 0, 0, 1, self.fps, 0, 0)
+        self.file.write(png_chunk(b"fcTL", fctl))
+        self.sequence += 1
+        if self.frames == 0:
+            self.file.write(png_chunk(b"IDAT", encoded))
+        else:
+            self.file.write(png_chunk(b"fdAT", struct.pack(">I", self.sequence) + encoded))
+            self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        if self.file is None or self.file.closed:
+            return
+        if self.actl_offset is not None:
+            self.file.write(png_chunk(b"IEND", b""))
+            self.file.seek(self.actl_offset)
+            self.file.write(png_chunk(b"acTL", struct.pack(">II", self.frames, 0)))
+        self.file.close()
+
+
+class GIFWriter(IndexedWriter):
+    """Looping GIF89a. Delays are in hundredths of a second, so fps above 50 are not honored by most viewers."""
+
+    def __init__(self, filename, palette, fps=30, scale=1):
+        super().__init__(filename, palette, fps, scale)
+        self.file = None if filename is None else open(filename, "wb")
+        self.table_bits = max(1, (len(self.palette) - 1).bit_length())
+        self.min_code_size = max(2, self.table_bits)
+        self.delay = max(1, round(100 / fps))
+        self.started = False
+
+    def encode_frame(self, frame):
+        height, width = frame.shape
+        data = lzw_encode(frame.tobytes(), self.min_code_size)
+        blocks = b"".join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255))
+        return (
+            b"\x21\xF9\x04\x00" + struct.pack("<H", self.delay) + b"\x00\x00"  # graphic control extension
+            + b"\x2C" + struct.pack("<HHHHB", 0, 0, width, height, 0)  # image descriptor
+            + bytes([self.min_code_size]) + blocks + b"\x00"
+        )
+
+    def write_encoded(self, encoded, shape):
+        if not self.started:
+            height, width = shape
+            color_table = np.zeros((1 << self.table_bits, 3), dtype=np.uint8)
+            color_table[:len(self.palette)] = self.palette
+            self.file.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF0 | (self.table_bits - 1), 0, 0))
+            self.file.write(color_table.tobytes())
+            # loop forever
+            self.file.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")
+            self.started = True
+        self.file.write(encoded)
+        self.frames += 1
+
+    def close(self):
+        if self.file is None or self.file.closed:
+            return
+        if self.started:
+            self.file.write(b"\x3B")
+        self.file.close()
+
+
+WRITERS = {
+    "png": PNGSequenceWriter,
+    "apng": APNGWriter,
+    "gif": GIFWriter,
+}
+
+
+class GameIndexed(GameRecorder):
+    """Runs the simulation headless and writes palette-indexed frames at grid resolution."""
+
+    format = "apng"
+    extension = ".png"
+
+    def __init__(self, width=800, height=600, cell_size=10, rules=None, fps=10, run_seconds=60, ca=None, scale=1,
+                 filename=None):
+        super().__init__(width, height, cell_size, rules, fps, run_seconds, ca,
+                         filename=filename or f"output{self.extension}")
+        self.scale = scale
+        self.output_files = [self.filename]
+        self.writer = WRITERS[self.format](self.filename, self.ca.rules.get_palette(), fps=fps, scale=scale)
+
+    def open(self, total_frames):
+        pass
+
+    def write_frame(self, grid):
+        self.writer.write(grid)
+
+    def close(self):
+        self.writer.close()
+
+
+class GamePNG(GameIndexed):
+    format = "png"
+    extension = "_frames"  # a directory of frames
+
+
+class GameAPNG(GameIndexed):
+    format = "apng"
+    extension = ".png"
+
+
+class GameGIF(GameIndexed):
+    format = "gif"
+    extension = ".gif"
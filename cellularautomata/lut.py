@@ -0,0 +1,221 @@
+"""Dense lookup tables for evaluating rules over the whole grid at once.
+
+`compile_rules` turns a `Rules` subclass that describes its configuration as a
+function of (state, neighbor states) into a table indexed by an integer key,
+plus a vectorized encoder that computes the key of every cell in the grid.
+"""
+import hashlib
+import inspect
+import itertools
+import logging
+import numpy as np
+
+from cellularautomata.neighborhood import Neighborhood
+
+logger = logging.getLogger(__name__)
+
+MAX_TABLE_SIZE = 2**22
+"""Largest number of table entries compile_rules will build."""
+
+
+class LookupTable:
+    """Table of next states indexed by an integer encoding of a cell's configuration."""
+
+    def __init__(self, shape, neighborhood=None, default_state=0, table=None):
+        self.neighborhood = Neighborhood.moore(1) if neighborhood is None else neighborhood
+        self.size = len(self.neighborhood)
+        self.table = np.full(shape, default_state, dtype=np.int64) if table is None else table
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(num_states={self.num_states}, shape={self.table.shape})"
+
+    def __setitem__(self, key, result_state):
+        state, neighbors = key
+        self.table[self.index(state, neighbors)] = result_state
+
+    def __getitem__(self, key):
+        state, neighbors = key
+        return self.table[self.index(state, neighbors)]
+
+    def index(self, state, neighbors) -> tuple:
+        raise NotImplementedError("This method should map a state and its neighbor states to a table index.")
+
+    def configurations(self):
+        """Yield a (state, neighbors) representative for every entry of the table."""
+        raise NotImplementedError("This method should enumerate the configuration space.")
+
+    def encode(self, padded: np.ndarray) -> np.ndarray:
+        """Integer key of every cell's configuration, indexing the flattened table.
+        `padded` is the grid surrounded by `neighborhood.radius` ghost cells."""
+        raise NotImplementedError("This method should encode the configuration of every cell in the grid.")
+
+    def step(self, padded: np.ndarray) -> np.ndarray:
+        return self.table.ravel()[self.encode(padded)].astype(padded.dtype)
+
+
+class CountTable(LookupTable):
+    """Lookup table for order-independent rules.
+
+    The next state only depends on the cell's own state and how many of its
+    neighbors are in each state, so the table is indexed by
+    (state, count of state 0, ..., count of state k-2). The count of the last
+    state is implied because the counts sum to the neighborhood size."""
+
+    def __init__(self, num_states, neighborhood=None, default_state=0, table=None):
+        self.num_states = num_states
+        neighborhood = Neighborhood.moore(1) if neighborhood is None else neighborhood
+        super().__init__(self.table_shape(num_states, len(neighborhood)), neighborhood, default_state, table)
+
+    @staticmethod
+    def table_shape(num_states, size) -> tuple:
+        return (num_states,) + (size + 1,) * (num_states - 1)
+
+    def index(self, state, neighbors):
+        counts = [0] * self.num_states
+        for n in neighbors:
+            counts[n] += 1
+        return (state,) + tuple(counts[:-1])
+
+    def configurations(self):
+        for state in range(self.num_states):
+            for neighbors in itertools.combinations_with_replacement(range(self.num_states), self.size):
+                yield state, neighbors
+
+    def encode(self, padded):
+        counts = self.neighborhood.histogram_padded(padded, self.num_states - 1)
+        return np.ravel_multi_index((self.neighborhood.interior(padded), *counts), self.table.shape)
+
+
+class PositionTable(LookupTable):
+    """Lookup table for rules that depend on where each neighbor is.
+
+    The key is the state followed by the neighbor states (in the order of the
+    neighborhood offsets) read as the digits of a base-k number."""
+
+    def __init__(self, num_states, neighborhood=None, default_state=0, table=None):
+        self.num_states = num_states
+        neighborhood = Neighborhood.moore(1) if neighborhood is None else neighborhood
+        super().__init__(self.table_shape(num_states, len(neighborhood)), neighborhood, default_state, table)
+
+    @staticmethod
+    def table_shape(num_states, size) -> tuple:
+        return (num_states,) * (size + 1)
+
+    def index(self, state, neighbors):
+        return (state,) + tuple(neighbors)
+
+    def configurations(self):
+        for state in range(self.num_states):
+            for neighbors in itertools.product(range(self.num_states), repeat=self.size):
+                yield state, neighbors
+
+    def encode(self, padded):
+        keys = self.neighborhood.interior(padded).astype(np.int64)
+        for neighbors in self.neighborhood.shifted(padded):
+            keys *= self.num_states
+            keys += neighbors
+        return keys
+
+
+def _code_fingerprint(code) -> bytes:
+    """The bytecode, names and constants of a code object and the ones nested in it.
+    Line numbers are left out, so moving code around keeps cached tables."""
+    parts = [code.co_code, repr((code.co_names, code.co_varnames, code.co_freevars)).encode()]
+    for const in code.co_consts:
+        parts.append(_code_fingerprint(const) if inspect.iscode(const) else repr(const).encode())
+    return b"\0".join(parts)
+
+
+def _functions(attr):
+    """The functions behind a class attribute: methods, static and class methods,
+    properties and what decorators such as `cached` wrap."""
+    if isinstance(attr, property):
+        candidates = [attr.fget, attr.fset, attr.fdel]
+    else:
+        candidates = [getattr(attr, "__func__", attr)]
+    for function in candidates:
+        while function is not None and hasattr(function, "__code__"):
+            yield function
+            function = getattr(function, "__wrapped__", None)
+
+
+def code_digest(rules) -> str:
+    """sha256 of the code of every method along the class hierarchy of `rules`
+    and of the module-level functions they call.
+
+    Part of the cache key of compiled tables, so editing (or patching) the code
+    that fills a table, `get_neighborhood_configuration` and whatever it calls,
+    builds a new table instead of loading the old one."""
+    digest = hashlib.sha256()
+    seen = set()
+
+    def add(label, function):
+        if function in seen:
+            return
+        seen.add(function)
+        digest.update(label.encode())
+        digest.update(_code_fingerprint(function.__code__))
+        for name in function.__code__.co_names:
+            called = function.__globals__.get(name)
+            if inspect.isfunction(called):
+                add(f"{called.__module__}.{called.__qualname__}", called)
+
+    for cls in type(rules).__mro__[:-1]:  # all but object
+        for name, attr in sorted(vars(cls).items()):
+            for function in _functions(attr):
+                add(f"{cls.__module__}.{cls.__qualname__}.{name}", function)
+    return digest.hexdigest()
+
+
+def compile_rules(rules, max_table_size=MAX_TABLE_SIZE, cache=None):
+    """Tabulate `rules` so the whole grid can be stepped with one table lookup.
+
+    The rules must implement `get_neighborhood_configuration(state, neighbors)`
+    and set `symmetric` if the order of the neighbors does not matter.
+    Returns None if the rules do not describe their configuration that way, or
+    if the table would have more than `max_table_size` entries, in which case
+    the engines gather neighborhoods instead. That is the expected path for rules
+    with many states, so it is only logged at debug level.
+    Tables of rules that describe themselves with `cache_params` are stored in
+    and memory-mapped from the DiskCache `cache`, keyed on those parameters and
+    on the code of the rules (`code_digest`)."""
+    num_states = len(rules.possible_states)
+    neighborhood = rules.neighborhood
+    try:
+        rules.get_neighborhood_configuration(rules.default_state, (rules.default_state,) * len(neighborhood))
+    except NotImplementedError:
+        return None
+
+    table_cls = CountTable if rules.symmetric else PositionTable
+    # as a float, since the count overflows for hundreds of states
+    table_size = np.prod(table_cls.table_shape(num_states, len(neighborhood)), dtype=float)
+    if table_size > max_table_size:
+        logger.debug(
+            "%r has %.3g configurations, more than the %d that can be tabulated; gathering neighborhoods instead",
+            rules, table_size, max_table_size,
+        )
+        return None
+
+    def build():
+        table = table_cls(num_states, neighborhood, rules.default_state)
+        for state, neighbors in table.configurations():
+            configuration = rules.get_neighborhood_configuration(state, neighbors)
+            table[state, neighbors] = rules.rules.get(configuration, rules.default_state)
+        return table
+
+    params = rules.cache_params()
+    if cache is None or params is None:
+        return build()
+    key = cache.key(
+        "table",
+        rules=f"{type(rules).__module__}.{type(rules).__qualname__}",
+        params=params,
+        table=table_cls.__name__,
+        num_states=num_states,
+        neighborhood=neighborhood.mask.tolist(),
+        default_state=rules.default_state,
+        # rules added with add_rule and edits to the code that fills the table change it too
+        rules_digest=cache.key("rules", rules=sorted(rules.rules.items(), key=repr)),
+        code_digest=code_digest(rules),
+    )
+    return table_cls(num_states, neighborhood, rules.default_state, table=cache.get(key, lambda: build().table))
@@ -0,0 +1,217 @@
+"""Neighborhood shapes, ghost-cell padding and whole-grid neighbor counting.
+
+A neighborhood is a boolean mask of side 2r+1 centred on the cell. Grids are
+stepped in a padded layout: the grid surrounded by r ghost cells on every side,
+filled according to the boundary condition (see `pad` and `fill_ghosts`), so
+every neighbor is reached with plain offset slicing and no modulo. Counts are
+computed for the whole grid at once and their cost does not grow with the radius:
+- Moore (square) neighborhoods use a summed-area table over the padded grid.
+- Any other mask (von Neumann, custom) uses an FFT correlation of the padded grid.
+Rules that are evaluated cell by cell instead gather every neighborhood at once
+through `index_table`, a per-shape table of flat neighbor indices kept in shared
+memory so every engine and worker process reuses it.
+"""
+import numpy as np
+
+from cellularautomata.shared import SharedArray
+
+MAX_INDEX_TABLES = 4
+"""Grid shapes a neighborhood keeps index tables for; the least recently used is dropped first."""
+
+BOUNDARIES = {
+    "toroidal": "wrap",
+    "fixed": "constant",
+    "reflective": "symmetric",
+    "absorbing": "constant",
+}
+"""Boundary conditions and the np.pad mode that fills their ghost cells.
+Fixed boundaries are held at a given value, absorbing ones at state 0, and
+reflective ones mirror the cells along the edge."""
+
+
+def pad(grid: np.ndarray, radius: int, boundary="toroidal", value=0) -> np.ndarray:
+    """Copy of `grid` surrounded by `radius` ghost cells on every side."""
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"boundary {boundary} not recognized, expected one of {list(BOUNDARIES)}")
+    pad_width = [(0, 0)] * (grid.ndim - 2) + [(radius, radius), (radius, radius)]
+    if BOUNDARIES[boundary] == "constant":
+        return np.pad(grid, pad_width, mode="constant", constant_values=value if boundary == "fixed" else 0)
+    return np.pad(grid, pad_width, mode=BOUNDARIES[boundary])
+
+
+def fill_ghosts(padded: np.ndarray, radius: int, boundary="toroidal", value=0):
+    """Refresh the ghost cells of a padded grid in place from its interior."""
+    r = radius
+    if r == 0:
+        return
+    rows, cols = padded.shape[0] - 2 * r, padded.shape[1] - 2 * r
+    if boundary in ("fixed", "absorbing"):
+        fill = value if boundary == "fixed" else 0
+        padded[:r] = padded[-r:] = fill
+        padded[:, :r] = padded[:, -r:] = fill
+    elif r > rows or r > cols:
+        # ghost layers deeper than the grid repeat it more than once
+        padded[...] = pad(padded[r:-r, r:-r], r, boundary, value)
+    elif boundary == "toroidal":
+        # rows first, then columns over the full height so the corners are filled too
+        padded[:r] = padded[rows:rows + r]
+        padded[-r:] = padded[r:2 * r]
+        padded[:, :r] = padded[:, cols:cols + r]
+        padded[:, -r:] = padded[:, r:2 * r]
+    elif boundary == "reflective":
+        padded[:r] = padded[r:2 * r][::-1]
+        padded[-r:] = padded[rows:rows + r][::-1]
+        padded[:, :r] = padded[:, r:2 * r][:, ::-1]
+        padded[:, -r:] = padded[:, cols:cols + r][:, ::-1]
+    else:
+        raise ValueError(f"boundary {boundary} not recognized, expected one of {list(BOUNDARIES)}")
+
+
+class Neighborhood:
+    """A set of cell offsets described by a square boolean mask."""
+
+    def __init__(self, mask, include_center=False, kind="custom"):
+        mask = np.array(mask, dtype=bool)
+        if mask.ndim != 2 or mask.shape[0] != mask.shape[1] or mask.shape[0] % 2 == 0:
+            raise ValueError("mask must be a square 2D array with an odd side length")
+        self.radius = mask.shape[0] // 2
+        mask[self.radius, self.radius] = include_center
+        self.mask = mask
+        self.include_center = include_center
+        self.kind = kind
+        self._kernels = {}
+        self._index_tables = {}
+
+    @classmethod
+    def moore(cls, radius=1, include_center=False):
+        """Square neighborhood: every cell within Chebyshev distance `radius`."""
+        mask = np.ones((2 * radius + 1, 2 * radius + 1), dtype=bool)
+        return cls(mask, include_center=include_center, kind="moore")
+
+    @classmethod
+    def von_neumann(cls, radius=1, include_center=False):
+        """Diamond neighborhood: every cell within Manhattan distance `radius`."""
+        x, y = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+        return cls(np.abs(x) + np.abs(y) <= radius, include_center=include_center, kind="von_neumann")
+
+    def __repr__(self):
+        return f"Neighborhood(kind={self.kind!r}, radius={self.radius}, size={len(self)})"
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    @property
+    def offsets(self) -> tuple:
+        """Row and column offsets of the neighbors, in row-major order."""
+        dx, dy = np.nonzero(self.mask)
+        return dx - self.radius, dy - self.radius
+
+    def interior(self, padded: np.ndarray) -> np.ndarray:
+        """View of the grid inside the ghost cells of a padded array."""
+        r = self.radius
+        return padded[..., r:padded.shape[-2] - r, r:padded.shape[-1] - r]
+
+    def shifted(self, padded: np.ndarray):
+        """Yield, for each offset in order, a view of the padded array holding that neighbor of every cell."""
+        r = self.radius
+        rows, cols = padded.shape[-2] - 2 * r, padded.shape[-1] - 2 * r
+        for dx, dy in zip(*self.offsets):
+            yield padded[..., r + dx:r + dx + rows, r + dy:r + dy + cols]
+
+    def sum(self, values: np.ndarray, boundary="toroidal", value=0) -> np.ndarray:
+        """Sum `values` over the neighborhood of every cell.
+
+        The last two axes of `values` are the grid; any leading axes are
+        treated as a batch. Returns an int64 array of the same shape."""
+        return self.sum_padded(pad(np.asarray(values), self.radius, boundary, value))
+
+    def sum_padded(self, padded: np.ndarray) -> np.ndarray:
+        """Like `sum`, for values already surrounded by `radius` ghost cells.
+        Returns the sums of the interior cells."""
+        padded = np.asarray(padded)
+        if self.kind == "moore":
+            totals = self._box_sum(padded)
+            if not self.include_center:
+                totals -= self.interior(padded)
+            return totals
+        return self._fft_sum(padded)
+
+    def count(self, grid: np.ndarray, state=None) -> np.ndarray:
+        """Number of neighbors of every cell that are non-zero (or equal to `state`)."""
+        return self.sum(grid != 0 if state is None else grid == state)
+
+    def count_padded(self, padded: np.ndarray, state=None) -> np.ndarray:
+        return self.sum_padded(padded != 0 if state is None else padded == state)
+
+    def histogram(self, grid: np.ndarray, num_states: int) -> np.ndarray:
+        """Per-state neighbor counts: result[s, i, j] is the number of neighbors
+        of cell (i, j) in state s."""
+        return self.histogram_padded(pad(grid, self.radius), num_states)
+
+    def histogram_padded(self, padded: np.ndarray, num_states: int) -> np.ndarray:
+        one_hot = np.arange(num_states)[:, None, None] == padded[None, :, :]
+        return self.sum_padded(one_hot)
+
+    def index_table(self, rows: int, cols: int) -> SharedArray:
+        """Flat indices of the neighbors of every cell of a padded (rows, cols) grid.
+
+        Row `i * cols + j` holds the indices into the raveled padded grid of the
+        neighbors of cell (i, j) in the order of the offsets, so
+        `np.take(padded.ravel(), table)` gathers all neighborhoods in one call.
+        Built once per shape as a contiguous int32 array in shared memory. At most
+        MAX_INDEX_TABLES are kept; a dropped table's block is unlinked as soon as
+        no engine holds the SharedArray any more."""
+        table = self._index_tables.pop((rows, cols), None)
+        if table is not None:
+            # most recently used last
+            self._index_tables[(rows, cols)] = table
+        else:
+            r = self.radius
+            if (rows + 2 * r) * (cols + 2 * r) >= 2**31:
+                raise ValueError(f"a {rows}x{cols} grid is too large for an int32 index table")
+            dx, dy = self.offsets
+            i = np.arange(rows, dtype=np.int64)[:, None, None]
+            j = np.arange(cols, dtype=np.int64)[None, :, None]
+            flat = (i + r + dx) * (cols + 2 * r) + j + r + dy
+            table = self._index_tables[(rows, cols)] = SharedArray.from_array(
+                flat.reshape(rows * cols, len(self)).astype(np.int32)
+            )
+            while len(self._index_tables) > MAX_INDEX_TABLES:
+                del self._index_tables[next(iter(self._index_tables))]
+        return table
+
+    def drop_index_table(self, rows: int, cols: int):
+        """Stop keeping the index table of (rows, cols) grids, e.g. when an engine closes."""
+        self._index_tables.pop((rows, cols), None)
+
+    def _box_sum(self, padded):
+        r = self.radius
+        rows, cols = padded.shape[-2] - 2 * r, padded.shape[-1] - 2 * r
+        # summed-area table with a leading row and column of zeros
+        sat = np.zeros(padded.shape[:-2] + (padded.shape[-2] + 1, padded.shape[-1] + 1), dtype=np.int64)
+        np.cumsum(np.cumsum(padded, axis=-2, dtype=np.int64), axis=-1, out=sat[..., 1:, 1:])
+        k = 2 * r + 1
+        return (
+            sat[..., k:k + rows, k:k + cols]
+            - sat[..., :rows, k:k + cols]
+            - sat[..., k:k + rows, :cols]
+            + sat[..., :rows, :cols]
+        )
+
+    def _fft_sum(self, padded):
+        shape = padded.shape[-2:]
+        kernel = self._kernels.get(shape)
+        if kernel is None:
+            k = np.zeros(shape)
+            dx, dy = self.offsets
+            k[dx % shape[0], dy % shape[1]] = 1
+            kernel = self._kernels[shape] = np.conj(np.fft.rfft2(k))
+        # the correlation wraps around the padded array, but the interior only reaches into the ghost cells
+        totals = np.fft.irfft2(np.fft.rfft2(padded) * kernel, s=shape)
+        return np.rint(self.interior(totals)).astype(np.int64)
+
+
+NEIGHBORHOODS = {
+    "moore": Neighborhood.moore,
+    "von_neumann": Neighborhood.von_neumann,
+}
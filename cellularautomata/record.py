@@ -0,0 +1,83 @@
+"""Headless recording of grid histories.
+
+Only needs NumPy. The history is written to a (frames, rows, cols) .npy file as
+the simulation runs, with a .json sidecar holding the frame count, fps and
+palette needed to render it later.
+"""
+import json
+import os
+from itertools import islice
+import numpy as np
+
+from cellularautomata.ca import CellularAutomata
+
+
+class GameRecorder:
+    def __init__(self, width=800, height=600, cell_size=10, rules=None, fps=10, run_seconds=60, ca=None,
+                 filename="output.npy"):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.fps = fps
+        self.run_seconds = run_seconds
+        rows, cols = self.height // cell_size, self.width // cell_size
+        if ca is None:
+            self.ca = CellularAutomata(rows, cols, rules)
+        else:
+            self.ca = ca
+        self.filename = filename
+        self.meta_filename = os.path.splitext(filename)[0] + ".json"
+        self.output_files = [self.filename, self.meta_filename]
+        self.frames = 0
+
+    def run(self):
+        total_frames = self.run_seconds * self.fps
+        self.open(total_frames)
+        print(f"Recording {total_frames} frames to {self.filename}")
+        try:
+            # the first frame is the initial grid; stops early if the grid reaches a fixed point,
+            # the remaining frames would be identical
+            for grid in islice(self.ca.iter_generations(), total_frames):
+                self.write_frame(grid)
+                self.frames += 1
+                # log the progress every 1% of the total frames
+                if self.frames % max(total_frames // 100, 1) == 0:
+                    print(f"{self.frames / total_frames * 100:.0f}% done")
+        finally:
+            self.close()
+
+    def open(self, total_frames):
+        dtype = np.min_scalar_type(len(self.ca.rules.possible_states) - 1)
+        self.history = np.lib.format.open_memmap(
+            self.filename, mode="w+", dtype=dtype, shape=(total_frames, self.ca.rows, self.ca.cols)
+        )
+
+    def write_frame(self, grid):
+        self.history[self.frames] = grid
+
+    def close(self):
+        self.history.flush()
+        del self.history
+        self.write_meta()
+
+    def write_meta(self):
+        rules = self.ca.rules
+        meta = {
+            "frames": self.frames,
+            "fps": self.fps,
+            "cell_size": self.cell_size,
+            "rows": self.ca.rows,
+            "cols": self.ca.cols,
+            "rules": repr(rules),
+            "palette": rules.get_palette().tolist(),
+        }
+        with open(self.meta_filename, "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+def load_recording(filename):
+    """Memory-map a recorded history, returning (frames, meta) trimmed to the recorded frame count."""
+    with open(os.path.splitext(filename)[0] + ".json") as f:
+        meta = json.load(f)
+    history = np.load(filename, mmap_mode="r")
+    return history[:meta["frames"]], meta
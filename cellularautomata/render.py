@@ -0,0 +1,127 @@
+"""Parallel rendering of recorded runs.
+
+Simulating is sequential, but once a run has been recorded (see
+`cellularautomata.record`) its frames are independent. `render` splits the
+history into time segments, colors and encodes each segment in a worker
+process and joins the segments in order into one output:
+- APNG, GIF and PNG sequences are built from frames encoded independently by
+  the workers (`IndexedWriter.encode_frame`), so the result is byte-identical
+  to encoding the frames one by one.
+- MP4 segments are written by OpenCV, each starting on a keyframe, and joined
+  without re-encoding by ffmpeg's concat demuxer. Without ffmpeg on the PATH
+  the video is encoded in a single segment.
+Workers memory-map the recording, so no frames are sent between processes.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import warnings
+from functools import partial
+import numpy as np
+
+from cellularautomata.indexed import WRITERS, upscale
+from cellularautomata.record import load_recording
+from cellularautomata.shared import worker_context
+
+FORMATS = ("mp4", "apng", "gif", "png")
+
+EXTENSIONS = {".mp4": "mp4", ".png": "apng", ".gif": "gif", "": "png"}
+"""Format implied by the extension of the output filename; a directory holds a PNG sequence."""
+
+
+def split(frames: int, segments: int) -> list:
+    """(start, stop) bounds of `segments` nearly equal runs of frames, skipping empty ones."""
+    bounds = np.linspace(0, frames, max(1, min(segments, frames)) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def encode_indexed_segment(filename, format, palette, fps, scale, bounds):
+    """Encoded frames start:stop of a recording and their (rows, cols) after scaling."""
+    history, _ = load_recording(filename)
+    encoder = WRITERS[format](None, palette, fps=fps, scale=scale)
+    encoded = []
+    start, stop = bounds
+    for frame in history[start:stop]:
+        frame = upscale(np.asarray(frame, dtype=np.uint8), scale)
+        encoded.append(encoder.encode_frame(frame))
+    return encoded, frame.shape
+
+
+def encode_mp4_segment(filename, palette, fps, cell_size, bounds, path):
+    """Color frames start:stop of a recording and encode them into the mp4 file `path`."""
+    import cv2
+
+    history, _ = load_recording(filename)
+    # OpenCV expects BGR
+    colors = np.ascontiguousarray(np.asarray(palette, dtype=np.uint8)[:, ::-1])
+    rows, cols = history.shape[1:]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (cols * cell_size, rows * cell_size))
+    try:
+        start, stop = bounds
+        for frame in history[start:stop]:
+            out.write(upscale(colors[frame], cell_size))
+    finally:
+        out.release()
+    return path
+
+
+def concat_mp4(paths, output, ffmpeg):
+    """Join mp4 segments with the same encoding settings into `output` without re-encoding."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for path in paths:
+            listing.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", listing.name, "-c", "copy", output],
+            check=True,
+        )
+    finally:
+        os.remove(listing.name)
+
+
+def render(filename, output=None, format=None, processes=None, segments=None, cell_size=None, scale=1, fps=None):
+    """Render the recording `filename` (a .npy history with its .json sidecar) to `output`.
+
+    `format` is inferred from the output's extension (mp4 by default), the
+    recorded fps and cell size are used unless overridden, and the frames are
+    split into `segments` encoded by `processes` workers (both default to the
+    number of cores). Returns the output filename."""
+    if format is None:
+        format = EXTENSIONS.get(os.path.splitext(output)[1].lower(), "mp4") if output else "mp4"
+    if format not in FORMATS:
+        raise ValueError(f"format {format} not recognized, expected one of {list(FORMATS)}")
+    if output is None:
+        extension = {"mp4": ".mp4", "apng": ".png", "gif": ".gif", "png": "_frames"}[format]
+        output = os.path.splitext(filename)[0] + extension
+    history, meta = load_recording(filename)
+    palette = meta["palette"]
+    fps = fps or meta["fps"]
+    processes = processes or os.cpu_count()
+    bounds = split(len(history), segments or processes)
+    if not bounds:
+        raise ValueError(f"{filename} has no recorded frames")
+
+    if format == "mp4":
+        ffmpeg = shutil.which("ffmpeg")
+        cell_size = cell_size or meta["cell_size"]
+        if ffmpeg is None:
+            if len(bounds) > 1:
+                warnings.warn("ffmpeg was not found on the PATH, encoding the video in a single segment", RuntimeWarning)
+            encode_mp4_segment(filename, palette, fps, cell_size, (0, len(history)), output)
+            return output
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"segment_{index:04d}.mp4") for index in range(len(bounds))]
+            encode = partial(encode_mp4_segment, filename, palette, fps, cell_size)
+            with worker_context().Pool(min(processes, len(bounds))) as pool:
+                pool.starmap(encode, zip(bounds, paths))
+            concat_mp4(paths, output, ffmpeg)
+        return output
+
+    encode = partial(encode_indexed_segment, filename, format, palette, fps, scale)
+    with worker_context().Pool(min(processes, len(bounds))) as pool, WRITERS[format](output, palette, fps=fps, scale=scale) as writer:
+        # imap hands back segments in order as soon as each is ready
+        for encoded, shape in pool.imap(encode, bounds):
+            for frame in encoded:
+                writer.write_encoded(frame, shape)
+    return output
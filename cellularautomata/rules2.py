@@ -1,11 +1,22 @@
-from functools import lru_cache
 import itertools
 from collections import Counter
 import random
 import colorsys
 import numpy as np
 
+from cellularautomata.cache import RuleCaches, cached
+from cellularautomata.diskcache import default_cache
+from cellularautomata.kernel import Kernel
+from cellularautomata.lut import compile_rules
+from cellularautomata.neighborhood import NEIGHBORHOODS, Neighborhood
+
 class Rules:
+    neighborhood = Neighborhood.moore(1)
+    """Cells whose states make up the neighbor vector, in the order of its offsets."""
+
+    symmetric = False
+    """Whether the configuration ignores the order of the neighbors."""
+
     def __init__(self):
         self.seed = random.randint(0, 100000) # Seed for the random number generator
         random.seed(self.seed)
@@ -13,21 +24,126 @@ class Rules:
         self.default_state = 0
         self.rules = {}
         self.possible_states = [0]
+        self._compiled = None
+        self._needs_compile = True
+        self.caches = RuleCaches()
 
     def add_rule(self, configuration: str, result_state):
         self.rules[configuration] = result_state
+        self._needs_compile = True
 
     def apply(self, grid, position: tuple):
+        """Next state of the cell at `position` of a grid padded with `neighborhood.radius` ghost cells."""
         configuration = self.get_configuration(grid, position)
         return self.rules.get(configuration, self.default_state)
 
+    @property
+    def compiled(self):
+        """The rules tabulated by `compile_rules`, or None if they cannot be tabulated."""
+        if self._needs_compile:
+            self._compiled = compile_rules(self, cache=default_cache())
+            self._needs_compile = False
+        return self._compiled
+
+    def step(self, padded: np.ndarray):
+        """Compute the next state of the whole grid at once from the grid surrounded
+        by `neighborhood.radius` ghost cells, returning the unpadded next grid.
+        Returns None if the rules only support the per-cell `apply` path."""
+        compiled = self.compiled
+        return None if compiled is None else compiled.step(padded)
+
+    def apply_gathered(self, states: np.ndarray, neighborhoods: np.ndarray):
+        """Next states of many cells from their states and their gathered neighbor states.
+
+        `neighborhoods` has one row per cell, ordered like the neighborhood offsets.
+        Returns None if the rules only support the per-cell `apply` path."""
+        try:
+            self.get_neighborhood_configuration(self.default_state, (self.default_state,) * len(self.neighborhood))
+        except NotImplementedError:
+            return None
+        return [
+            self.rules.get(self.get_neighborhood_configuration(state, tuple(neighbors)), self.default_state)
+            for state, neighbors in zip(states.tolist(), neighborhoods.tolist())
+        ]
+
+    def random_field(self, n: int):
+        """Random numbers for `n` cells, drawn up front by engines that split the grid between
+        processes and passed to `apply_gathered` as `rand`. None if the rules draw none that way."""
+        return None
+
     def get_configuration(self, grid, position) -> str:
         raise NotImplementedError("This method should provide the encoded configuration for the current grid and position.")
 
+    def get_neighborhood_configuration(self, state, neighbors: tuple):
+        """Encoded configuration of a cell from its state and its neighbor states.
+        Implementing this allows the rules to be compiled into a lookup table."""
+        raise NotImplementedError("This method should provide the encoded configuration for a state and its neighbors.")
+
+    def cache_params(self):
+        """Parameters that, with the class and the rules dict, determine the compiled table,
+        allowing it to be kept in the on-disk cache. None if the table should not be cached."""
+        return None
+
     def get_state_color(self, state):
         raise NotImplementedError("This method should provide the color representation for a given state.")
 
+    def get_state_colors(self, grid: np.ndarray):
+        return np.array([[self.get_state_color(state) for state in row] for row in grid])
+
+    def clear_caches(self):
+        """Empty the rule's memoization caches, e.g. between runs."""
+        self.caches.clear()
+
+    def cache_stats(self) -> dict:
+        """Hit, miss, eviction and memory statistics of each memoization cache."""
+        return self.caches.stats()
+
+    def get_palette(self) -> np.ndarray:
+        """Colors of all the possible states as a (num_states, 3) uint8 array indexed by state."""
+        return np.array([self.get_state_color(state) for state in self.possible_states], dtype=np.uint8)
+
+class KernelRules(Rules):
+    """Rules whose next state is computed by a scalar kernel, see `cellularautomata.kernel`.
+    Subclasses set `kernel` and return their parameters from `kernel_params`.
+    The kernel's result is looked up in `self.rules` like any other configuration."""
+
+    kernel: Kernel = None
+
+    @property
+    def rng(self) -> np.random.Generator:
+        """Source of the kernel's random numbers, seeded with the rules' seed."""
+        if getattr(self, "_rng", None) is None:
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+    def spawn(self, index: int):
+        """Switch to the `index`-th independent child stream of the seed's, for a copy of the rules
+        stepping one part of the grid in another process."""
+        self._rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+
+    def kernel_params(self) -> tuple:
+        return ()
+
+    def get_configuration(self, grid, position):
+        i, j = position
+        dx, dy = self.neighborhood.offsets
+        return self.kernel.apply_one(grid[i, j], grid[i + dx, j + dy], self.rng.random(), self.kernel_params())
+
+    def random_field(self, n):
+        return self.rng.random(n)
+
+    def apply_gathered(self, states: np.ndarray, neighborhoods: np.ndarray, rand=None):
+        # one random number per cell in row-major order, as drawn by the per-cell path
+        if rand is None:
+            rand = self.random_field(len(states))
+        next_states = self.kernel(states, neighborhoods, rand, self.kernel_params())
+        results = np.array([self.rules.get(state, self.default_state) for state in self.possible_states])
+        return results[next_states]
+
+
 class GameOfLifeRules(Rules):
+    symmetric = True
+
     def __init__(self):
         super().__init__()
         self.color_map = {
@@ -51,17 +167,20 @@ class GameOfLifeRules(Rules):
         alive_neighbors = self.count_alive_neighbors(grid, i, j)
         return f"{state}{'1' * alive_neighbors}".ljust(9, "0")
 
+    def get_neighborhood_configuration(self, state, neighbors: tuple) -> str:
+        return f"{state}{'1' * sum(neighbors)}".ljust(9, "0")
+
+    def cache_params(self):
+        return {}
+
     @staticmethod
     def count_alive_neighbors(grid, x, y):
-        rows = len(grid)
-        cols = len(grid[0])
         sum = 0
         for i in range(-1, 2):
             for j in range(-1, 2):
                 if i == 0 and j == 0:
                     continue
-                nx, ny = (x + i) % rows, (y + j) % cols
-                sum += grid[nx][ny]
+                sum += grid[x + i][y + j]
         return sum
 
     def get_state_color(self, state):
@@ -72,6 +191,8 @@ class GameOfLifeRules(Rules):
 class TripleLife(Rules):
     """3 state, 8 neigbors"""
 
+    symmetric = True
+
     def __init__(self):
         super().__init__()
         self.possible_states = [0, 1, 2]
@@ -98,10 +219,15 @@ class TripleLife(Rules):
         i, j = position
         state = grid[i][j]
         neighbors = self.get_neighbors(grid, position)
+        return self.get_neighborhood_configuration(state, neighbors)
+
+    def get_neighborhood_configuration(self, state, neighbors) -> str:
         # sort the neighbors so that the configuration is consistent
-        neighbors.sort()
-        neighbors = "".join(map(str, neighbors)).ljust(8, self.placeholder)
+        neighbors = "".join(map(str, sorted(neighbors))).ljust(8, self.placeholder)
         return f"{state}{neighbors}"
+
+    def cache_params(self):
+        return {"placeholder": self.placeholder}
     
 
     def add_rule(self, configuration: str, result_state, placeholder_alive_only=False, placeholder_dead_only=False):
@@ -127,17 +253,14 @@ class TripleLife(Rules):
         
 
     def get_neighbors(self, grid, position):
-        rows = len(grid)
-        cols = len(grid[0])
         i, j = position
         neighbors = []
-        # iterate over the 8 neighbors accounting for the grid wrapping
+        # iterate over the 8 neighbors, the ghost cells take care of the edges
         for x in range(-1, 2):
             for y in range(-1, 2):
                 if x == 0 and y == 0:
                     continue
-                nx, ny = (i + x) % rows, (j + y) % cols
-                neighbors.append(grid[nx][ny])
+                neighbors.append(grid[i + x][j + y])
 
         return neighbors
         
@@ -152,6 +275,12 @@ class TripleLife(Rules):
 
 
 class ElementaryCellularAutomata(Rules):
+    """Wolfram's elementary rules, applied to each row of a 2D grid independently.
+    See `cellularautomata.elementary.ElementaryEngine` for the 1D spacetime engine."""
+
+    neighborhood = Neighborhood([[0, 0, 0], [1, 0, 1], [0, 0, 0]])
+    """Left and right neighbors in the same row."""
+
     def __init__(self, rule_number):
         super().__init__()
         self.rule_number = rule_number
@@ -170,19 +299,85 @@ class ElementaryCellularAutomata(Rules):
 
     def get_configuration(self, grid, position) -> str:
         i, j = position
-        rows = len(grid)
-        cols = len(grid[0])
-        left = grid[i][(j - 1) % cols]
+        left = grid[i][j - 1]
         center = grid[i][j]
-        right = grid[i][(j + 1) % cols]
+        right = grid[i][j + 1]
         return f"{left}{center}{right}"
 
+    def get_neighborhood_configuration(self, state, neighbors: tuple) -> str:
+        left, right = neighbors
+        return f"{left}{state}{right}"
+
+    def cache_params(self):
+        return {"rule_number": self.rule_number}
+
     def get_state_color(self, state):
         return self.color_map.get(state, (255, 255, 255))  # Default to white if state is undefined
     
 
+class LargerThanLife(Rules):
+    """Larger than Life: a two-state totalistic rule over a neighborhood of radius r.
+    A dead cell is born if its live neighbor count is within `birth`, and a live cell
+    survives if its count is within `survival` (both ranges inclusive).
+    The defaults are Bosco's rule (R5, M1, B34..45, S34..58)."""
+
+    def __init__(self, radius=5, birth=(34, 45), survival=(34, 58), neighborhood="moore",
+                 include_center=True, seed=None, *args, **kwargs):
+        super().__init__()
+        if seed is not None:
+            self.seed = seed
+            random.seed(self.seed)
+            np.random.seed(self.seed)
+        self.neighborhood = NEIGHBORHOODS[neighborhood](radius, include_center=include_center)
+        self.birth = birth
+        self.survival = survival
+        self.num_states = 2
+        self.possible_states = [0, 1]
+        self.color_map = {
+            0: (0, 0, 0),
+            1: (255, 255, 255)
+        }
+
+    def __repr__(self):
+        return f"LargerThanLife(radius={self.neighborhood.radius}, birth={self.birth}, survival={self.survival}, neighborhood={self.neighborhood.kind!r})"
+
+    def __str__(self):
+        return f"""LargerThanLife
+
+Rules:
+1. A dead cell with {self.birth[0]}-{self.birth[1]} live cells in its {self.neighborhood.kind} neighborhood of radius {self.neighborhood.radius} is born.
+2. A live cell with {self.survival[0]}-{self.survival[1]} live cells in its neighborhood survives.
+3. Every other cell dies or stays dead.
+"""
+
+    def step(self, padded: np.ndarray):
+        counts = self.neighborhood.count_padded(padded)
+        grid = self.neighborhood.interior(padded)
+        born = (grid == 0) & (counts >= self.birth[0]) & (counts <= self.birth[1])
+        survive = (grid != 0) & (counts >= self.survival[0]) & (counts <= self.survival[1])
+        return (born | survive).astype(grid.dtype)
+
+    def get_configuration(self, grid, position) -> int:
+        i, j = position
+        dx, dy = self.neighborhood.offsets
+        count = np.count_nonzero(grid[i + dx, j + dy])
+        if grid[i, j]:
+            return int(self.survival[0] <= count <= self.survival[1])
+        return int(self.birth[0] <= count <= self.birth[1])
+
+    def apply(self, grid, position: tuple):
+        return self.get_configuration(grid, position)
+
+    def get_state_color(self, state):
+        return self.color_map.get(state, (255, 255, 255))  # Default to white if state is undefined
+
+
 class Rainbow(Rules):
     """Ruleset that cycles through the colors of the rainbow."""
+
+    neighborhood = Neighborhood([[0]])
+    """The next state only depends on the cell itself."""
+
     def __init__(self):
         super().__init__()
         self.colors = [
@@ -209,6 +404,12 @@ class Rainbow(Rules):
     def get_configuration(self, grid, position) -> int:
         return grid[position[0]][position[1]]
 
+    def get_neighborhood_configuration(self, state, neighbors: tuple) -> int:
+        return state
+
+    def cache_params(self):
+        return {}
+
     def get_state_color(self, state):
         return self.color_map.get(state, (255, 255, 255))  # Default to white if state is undefined
     
@@ -216,11 +417,16 @@ class Rainbow(Rules):
 class RainbowLife(Rules):
     """Each color represents a different state, and the rules allow for transitions between the colors."""
 
-    dx = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
-    dy = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
-    
-    def __init__(self, num_states=7, pastel=False, scroll=False, seed=None, *args, **kwargs):
+    neighborhood = Neighborhood.moore(1)
+    dx, dy = neighborhood.offsets
+
+    sort_neighbors = True
+    """Whether the neighbor states are sorted before computing the next state."""
+
+    def __init__(self, num_states=7, pastel=False, scroll=False, seed=None, cache_maxsize=2**16, cache_maxbytes=None,
+                 *args, **kwargs):
         super().__init__()
+        self.caches = RuleCaches(maxsize=cache_maxsize, maxbytes=cache_maxbytes)
         if seed is not None:
             self.seed = seed
             random.seed(self.seed)
@@ -277,6 +483,15 @@ Explanation of the rules:
         state = grid[position]
         return self.get_next_state(state, neighbors)
     
+    def apply_gathered(self, states: np.ndarray, neighborhoods: np.ndarray):
+        if self.sort_neighbors:
+            neighborhoods = np.sort(neighborhoods, axis=1)
+        # cells are visited in row-major order, so random choices match the per-cell path
+        return [
+            self.rules.get(self.get_next_state(state, tuple(neighbors)), self.default_state)
+            for state, neighbors in zip(states.tolist(), neighborhoods.tolist())
+        ]
+
     def get_next_state(self, state: int, neighbors: tuple):
         # If I'm the same color as all my neighbors, I change color
         # "Nonconformity is the only legitimate form of rebellion."
@@ -293,40 +508,34 @@ Explanation of the rules:
         unique_neighbors, weights = self._get_weights(neighbors)
         return random.choices(list(unique_neighbors), weights=weights)[0]
 
-    @staticmethod
-    @lru_cache(maxsize=None)
-    def _get_weights(neighbors):
+    @cached("weights")
+    def _get_weights(self, neighbors):
         unique_neighbors = set(neighbors)
         count = Counter(neighbors)
         weights = [count[n] for n in unique_neighbors]
         return unique_neighbors, weights
     
-    @staticmethod
-    @lru_cache(maxsize=None)
-    def _different_from_all(state, neighbors):
+    @cached("different_from_all")
+    def _different_from_all(self, state, neighbors):
         return set(neighbors) - {state} == set(neighbors)   
     
-    @staticmethod
-    @lru_cache(maxsize=None)
-    def _get_neighbor_weights(neighbors):
+    @cached("neighbor_weights")
+    def _get_neighbor_weights(self, neighbors):
         counter = Counter(neighbors)
         return [counter[n] for n in neighbors]
     
     def get_neighbors(self, grid: np.ndarray, position: tuple) -> tuple:
         """Extract the 8 neighbors of a cell."""
-        rows, cols = grid.shape
-        nx, ny = self.get_neighbor_positions(position, rows, cols)
+        nx, ny = self.get_neighbor_positions(position)
         neighbors = grid[nx, ny]
         # sort the neighbors so that the configuration is consistent
         neighbors.sort()
         return tuple(neighbors)
     
-    @staticmethod
-    @lru_cache(maxsize=None)
-    def get_neighbor_positions(position: tuple, rows, cols) -> tuple:
-        """Get the positions of the 8 neighbors of a cell."""
+    def get_neighbor_positions(self, position: tuple) -> tuple:
+        """Get the positions of the 8 neighbors of a cell in the padded grid."""
         i, j = position
-        return (i + RainbowLife.dx) % rows, (j + RainbowLife.dy) % cols
+        return i + self.dx, j + self.dy
     
     def get_state_color(self, state):
         return self.color_map.get(state, (255, 255, 255))  # Default to white if state is undefined
@@ -338,12 +547,21 @@ class RainbowLife2(RainbowLife):
     """RainbowLife with a different set of principles than the first one.
     Notes:
     - The equality_threshold parameter allows for a more flexible definition of "sameness".
+    - The rules are deterministic, so small state counts are compiled into a lookup table.
     """
+
+    symmetric = True
     
     def __init__(self, equality_threshold=0, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.equality_threshold = equality_threshold
 
+    def get_neighborhood_configuration(self, state, neighbors: tuple) -> int:
+        return self.get_next_state(state, tuple(sorted(neighbors)))
+
+    def cache_params(self):
+        return {"num_states": self.num_states, "equality_threshold": self.equality_threshold}
+
     def get_next_state(self, state: int, neighbors: tuple):
         # If I'm not the same color as any of my neighbors, I choose the least common color among them
         # "Ideas spread slowly, but they do spread."
@@ -371,9 +589,8 @@ Rules:
 3. "The truth is in the middle."
 """
 
-    @staticmethod
-    @lru_cache(maxsize=2**16)
-    def _get_equals(state, equality_threshold, num_states):
+    @cached("equals")
+    def _get_equals(self, state, equality_threshold, num_states):
         """Calculate the states considered equal to the current state based on the equality_threshold."""
         equals = []
         if equality_threshold == 0 or equality_threshold == 1:
@@ -386,41 +603,113 @@ Rules:
                 continue  # skip the wrapping around the range
         return equals
     
-    @staticmethod
-    @lru_cache(maxsize=2**16)
-    def _equal_to_any(state, neighbors, equality_threshold, num_states):
-        equals = RainbowLife2._get_equals(state, equality_threshold, num_states)
+    @cached("equal_to_any")
+    def _equal_to_any(self, state, neighbors, equality_threshold, num_states):
+        equals = self._get_equals(state, equality_threshold, num_states)
         return any(n in equals for n in neighbors)
     
-    @staticmethod
-    @lru_cache(maxsize=2**16)
-    def _equal_to_all(state, neighbors, equality_threshold, num_states):
-        equals = RainbowLife2._get_equals(state, equality_threshold, num_states)
+    @cached("equal_to_all")
+    def _equal_to_all(self, state, neighbors, equality_threshold, num_states):
+        equals = self._get_equals(state, equality_threshold, num_states)
         return all(n in equals for n in neighbors)
     
-    @staticmethod
-    @lru_cache(maxsize=2**16)
-    def _average_state(neighbors):
+    @cached("average_state")
+    def _average_state(self, neighbors):
         """Calculate the average state of the neighbors."""
         return sum(neighbors) // len(neighbors)
     
 
-class RainbowLife3(RainbowLife2):
+def rainbow_life3_kernel(state, neighbors, rand, params):
+    """Next state of a RainbowLife3 cell, see `RainbowLife3`."""
+    num_states = int(params[0])
+    equality_threshold = int(params[1])
+    # states within the threshold count as equal, as in RainbowLife2
+    reach = equality_threshold if equality_threshold > 1 else 0
+    equal_to_any = False
+    equal_to_all = True
+    for n in neighbors:
+        if abs(n - state) <= reach:
+            equal_to_any = True
+        else:
+            equal_to_all = False
+    # the cell faces one of its 8 neighbors, the one behind it is on the opposite side
+    direction = state % 8
+    ahead = neighbors[direction]
+    behind = neighbors[7 - direction]
+    # "Look where you are going."
+    if not equal_to_any:
+        return ahead
+    # "Nonconformity is the only legitimate form of rebellion."
+    if equal_to_all:
+        return (state + equality_threshold) % num_states
+    # "Go with the flow."
+    if rand < 0.5:
+        return ahead
+    return (ahead + behind) // 2
+
+
+def rainbow_life3_kernel_vectorized(states, neighborhoods, rand, params):
+    """`rainbow_life3_kernel` for many cells at once, with NumPy."""
+    num_states = int(params[0])
+    equality_threshold = int(params[1])
+    reach = equality_threshold if equality_threshold > 1 else 0
+    equal = np.abs(neighborhoods - states[:, None]) <= reach
+    direction = states % 8
+    ahead = np.take_along_axis(neighborhoods, direction[:, None], axis=1)[:, 0]
+    behind = np.take_along_axis(neighborhoods, 7 - direction[:, None], axis=1)[:, 0]
+    # the rules in reverse order, so that the first one that applies wins
+    next_states = np.where(rand < 0.5, ahead, (ahead + behind) // 2)
+    next_states = np.where(equal.all(axis=1), (states + equality_threshold) % num_states, next_states)
+    return np.where(equal.any(axis=1), next_states, ahead)
+
+
+class RainbowLife3(KernelRules, RainbowLife2):
     """RainbowLife3 with a different set of principles than the first one.
     Notes:
     - The equality_threshold parameter allows for a more flexible definition of "sameness".
-    - No longer sort the neighbors so we can use their relative positions.
+    - No longer sort the neighbors so we can use their relative positions: a cell in
+      state s faces its neighbor s % 8 (in row-major order) and has its back to the
+      opposite neighbor.
+    - Runs as a kernel, compiled with Numba when it is installed and vectorized with
+      NumPy when it is not.
     """
+
+    symmetric = False
+    sort_neighbors = False
+    kernel = Kernel(rainbow_life3_kernel, vectorized=rainbow_life3_kernel_vectorized)
     
     def __init__(self, equality_threshold=0, *args, **kwargs):
         super().__init__(equality_threshold, *args, **kwargs)
 
+    def __repr__(self):
+        return f"RainbowLife3(num_states={self.num_states}, equality_threshold={self.equality_threshold})"
+
+    def __str__(self):
+        return """RainbowLife3
+Rules:
+1. "Look where you are going."
+2. "Nonconformity is the only legitimate form of rebellion."
+3. "Go with the flow."
+
+Explanation of the rules:
+Each cell faces one of its 8 neighbors, chosen by its state.
+1. If a cell is not equal to any of its neighbors, it takes the state of the neighbor it faces.
+2. If a cell is equal to all its neighbors, it moves on by the equality threshold.
+3. Otherwise, it either takes the state of the neighbor it faces or meets halfway between
+   that neighbor and the one behind it, with equal odds.
+"""
+
+    def kernel_params(self) -> tuple:
+        return (self.num_states, self.equality_threshold)
+
+    def get_neighborhood_configuration(self, state, neighbors: tuple) -> int:
+        raise NotImplementedError("RainbowLife3 draws random numbers, so it cannot be tabulated.")
+
     def get_neighbors(self, grid: np.ndarray, position: tuple) -> tuple:
         """Extract the 8 neighbors of a cell."""
-        rows, cols = grid.shape
-        nx, ny = self.get_neighbor_positions(position, rows, cols)
+        nx, ny = self.get_neighbor_positions(position)
         neighbors = grid[nx, ny]
         return tuple(neighbors)
     
     def get_next_state(self, state: int, neighbors: tuple):
-        pass
\ No newline at end of file
+        return self.kernel.apply_one(state, neighbors, self.rng.random(), self.kernel_params())
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""NumPy arrays backed by shared memory that pickle by reference.
+
+A `SharedArray` sent to a worker process is pickled as the name of its
+shared-memory block, its shape and dtype; the worker attaches to the same
+memory instead of receiving a copy. Each process attaches to a block once.
+The creating process owns the block and unlinks it when the array is garbage
+collected, when `unlink()` is called or when the process exits.
+
+Worker processes are started from `worker_context()` rather than forked from
+the caller: a process whose Numba kernels have started their thread pool hangs
+at exit once it forks.
+"""
+import multiprocessing
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory, util
+import numpy as np
+
+_attached = {}
+"""Blocks this process has attached to, by name."""
+
+_inherited_tracker = {}
+"""Whether this process shares its parent's resource tracker, by pid (forked children inherit the dict)."""
+
+
+WORKER_PRELOAD = ["cellularautomata.ca", "cellularautomata.rules2", "cellularautomata.distributed"]
+"""Modules the forkserver imports once, rather than every worker importing them."""
+
+
+def worker_context():
+    """Multiprocessing context for worker processes: forkserver, or spawn where it is not
+    available. Both start workers from a fresh interpreter, so scripts that start engines
+    with workers need an `if __name__ == "__main__":` guard."""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # workers fork from a server that has already imported the engines and rules
+    context.set_forkserver_preload(WORKER_PRELOAD)
+    return context
+
+
+class SharedArray:
+    """An ndarray in a multiprocessing.shared_memory block, available as `.array`."""
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        shares_tracker()
+        if self.owner:
+            nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            # also runs when a worker process that created the block exits
+            self._finalizer = util.Finalize(self, _unlink, args=(self.shm,), exitpriority=0)
+        else:
+            self.shm = _attached.get(name)
+            if self.shm is None:
+                self.shm = _attached[name] = _attach(name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "SharedArray":
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    def __repr__(self):
+        return f"SharedArray(name={self.name!r}, shape={self.shape}, dtype={self.dtype})"
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __reduce__(self):
+        return SharedArray, (self.shape, self.dtype.str, self.name)
+
+    def unlink(self):
+        """Release the block. Only the owner can do this; other processes keep their mapping until they exit."""
+        if self.owner:
+            self._finalizer()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if not shares_tracker():
+        # attaching registered the block with this process's own tracker, which would unlink it
+        # (or warn that it leaked) when the process exits; only the owner decides when it goes away
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def shares_tracker() -> bool:
+    """Whether this process uses the resource tracker of the process that started it.
+
+    Children started by multiprocessing (fork, spawn and forkserver alike) once the parent has a
+    tracker share it: registering a block again is a no-op there and unregistering would drop the
+    owner's registration. Decided on the process's first use of shared memory, before it can start
+    a tracker of its own."""
+    pid = os.getpid()
+    if pid not in _inherited_tracker:
+        _inherited_tracker[pid] = resource_tracker._resource_tracker._fd is not None
+    return _inherited_tracker[pid]
+
+
+def _unlink(shm):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,364 @@
+"""Live streaming of generations to remote viewers.
+
+The simulation runs in a worker thread while an asyncio server publishes every
+generation to any number of viewers, over plain TCP or WebSocket. Viewers get a
+keyframe when they connect and then only the cells that changed. Each viewer
+has a bounded queue: when a slow viewer falls behind its frames are dropped and
+it is resynchronised with the next keyframe, so the simulation never waits.
+
+The HTTP port also serves a minimal canvas viewer (static/viewer.html).
+
+Protocol (every message starts with a one-byte type, integers are little-endian):
+- b"H" hello: rows (u16), cols (u16), bytes per state (u8), num_states (u16),
+  then the palette as num_states RGB triples
+- b"K" keyframe: generation (u32), then rows * cols states in row-major order
+- b"D" delta: generation (u32), count (u32), count flat cell indices (u32),
+  then the count new states
+Over TCP each message is prefixed with its length (u32). Over WebSocket each
+message is one binary frame.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+import numpy as np
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+VIEWER_HTML = os.path.join(os.path.dirname(__file__), "static", "viewer.html")
+
+
+def websocket_frame(payload: bytes, opcode=0x2) -> bytes:
+    """A single unmasked, final WebSocket frame (binary by default)."""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack(">BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def length_prefixed(payload: bytes) -> bytes:
+    return struct.pack("<I", len(payload)) + payload
+
+
+class Viewer:
+    """A connected client and the queue of messages waiting to be sent to it."""
+
+    def __init__(self, writer: asyncio.StreamWriter, frame, max_queue):
+        self.writer = writer
+        self.frame = frame
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.needs_keyframe = True
+        self.sent = 0
+        self.dropped = 0
+
+
+class FrameServer:
+    """Publishes the generations of a CellularAutomata to connected viewers.
+
+    Set `port` for plain TCP viewers and `http_port` for browsers (WebSocket and
+    the bundled viewer page); either can be None to disable it, or 0 to pick a
+    free port. `max_queue` is the number of frames a viewer may fall behind
+    before frames are dropped for it, at least 1."""
+
+    def __init__(self, ca, host="127.0.0.1", port=None, http_port=8765, max_queue=8, keyframe_interval=300,
+                 fps=None):
+        if max_queue < 1:
+            # asyncio.Queue(0) is unbounded, so a stalled viewer would never drop frames
+            raise ValueError(f"max_queue must be at least 1, got {max_queue}")
+        self.ca = ca
+        self.host = host
+        self.port = port
+        self.http_port = http_port
+        self.max_queue = max_queue
+        self.keyframe_interval = keyframe_interval
+        self.fps = fps
+        num_states = len(ca.rules.possible_states)
+        self.state_dtype = np.dtype("<u1") if num_states <= 256 else np.dtype("<u2")
+        self.hello = (
+            struct.pack("<cHHBH", b"H", ca.rows, ca.cols, self.state_dtype.itemsize, num_states)
+            + ca.rules.get_palette().tobytes()
+        )
+        self.viewers = set()
+        self.servers = []
+        self.handlers = set()
+        self.generation = 0
+        self.latest = None
+
+    @property
+    def addresses(self) -> list:
+        """(host, port) of every listening socket."""
+        return [sock.getsockname()[:2] for server in self.servers for sock in server.sockets]
+
+    def encode_keyframe(self, generation, grid) -> bytes:
+        return struct.pack("<cI", b"K", generation) + grid.astype(self.state_dtype).tobytes()
+
+    def encode_delta(self, generation, grid, previous) -> bytes:
+        changed = np.flatnonzero(grid != previous)
+        if len(changed) * (4 + self.state_dtype.itemsize) >= grid.size * self.state_dtype.itemsize:
+            # so much changed that the whole grid is smaller
+            return self.encode_keyframe(generation, grid)
+        return (
+            struct.pack("<cII", b"D", generation, len(changed))
+            + changed.astype("<u4").tobytes()
+            + grid.ravel()[changed].astype(self.state_dtype).tobytes()
+        )
+
+    def publish(self, generation, grid, previous=None):
+        """Queue a generation for every viewer without waiting for any of them."""
+        self.generation = generation
+        self.latest = grid
+        keyframe = delta = None
+        for viewer in self.viewers:
+            if viewer.needs_keyframe or previous is None or generation % self.keyframe_interval == 0:
+                message = keyframe = keyframe or self.encode_keyframe(generation, grid)
+            else:
+                message = delta = delta or self.encode_delta(generation, grid, previous)
+            try:
+                viewer.queue.put_nowait(message)
+                if message is keyframe:
+                    viewer.needs_keyframe = False
+            except asyncio.QueueFull:
+                # the viewer is behind, skip this frame and resync it with a keyframe later
+                viewer.dropped += 1
+                viewer.needs_keyframe = True
+
+    async def start(self):
+        if self.port is not None:
+            self.servers.append(await asyncio.start_server(self._handle_tcp, self.host, self.port))
+        if self.http_port is not None:
+            self.servers.append(await asyncio.start_server(self._handle_http, self.host, self.http_port))
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+        for viewer in list(self.viewers):
+            viewer.writer.close()
+        # let the connection handlers see their sockets close and finish
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    async def run(self, generations=None):
+        """Step the simulation in a worker thread and publish every generation.
+        Stops after `generations` steps or when the grid stops changing."""
+        loop = asyncio.get_running_loop()
+        previous = self.ca.grid.copy()
+        self.publish(self.generation, previous)
+        steps = 0
+        while generations is None or steps < generations:
+            started = loop.time()
+            if not await loop.run_in_executor(None, self.ca.update):
+                break
+            steps += 1
+            grid = self.ca.grid.copy()
+            self.publish(self.generation + 1, grid, previous)
+            previous = grid
+            delay = 1 / self.fps - (loop.time() - started) if self.fps else 0
+            await asyncio.sleep(max(delay, 0))
+
+    async def serve(self, generations=None, linger=False):
+        """Start the servers, run the simulation, and keep serving the last frame if `linger`."""
+        await self.start()
+        try:
+            await self.run(generations)
+            if linger:
+                await asyncio.Event().wait()
+        finally:
+            await self.close()
+
+    async def _attach(self, viewer, read_until_closed):
+        handler = asyncio.current_task()
+        self.handlers.add(handler)
+        tasks = set()
+        try:
+            # the hello and the current keyframe go straight to the socket rather than through the
+            # bounded queue; nothing is awaited before the viewer is registered, so it misses no delta
+            viewer.writer.write(viewer.frame(self.hello))
+            viewer.sent += 1
+            if self.latest is not None:
+                viewer.writer.write(viewer.frame(self.encode_keyframe(self.generation, self.latest)))
+                viewer.sent += 1
+                viewer.needs_keyframe = False
+            self.viewers.add(viewer)
+            tasks = {asyncio.create_task(self._pump(viewer)), asyncio.create_task(read_until_closed)}
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not tasks:
+                read_until_closed.close()
+            for task in tasks:
+                task.cancel()
+            self.viewers.discard(viewer)
+            self.handlers.discard(handler)
+            viewer.writer.close()
+
+    async def _pump(self, viewer):
+        try:
+            while True:
+                message = await viewer.queue.get()
+                viewer.writer.write(viewer.frame(message))
+                await viewer.writer.drain()
+                viewer.sent += 1
+                if viewer.needs_keyframe and viewer.queue.empty() and self.latest is not None:
+                    # caught up after dropping frames, resync now rather than waiting for the next generation
+                    viewer.queue.put_nowait(self.encode_keyframe(self.generation, self.latest))
+                    viewer.needs_keyframe = False
+        except ConnectionError:
+            pass
+
+    async def _handle_tcp(self, reader, writer):
+        async def read_until_closed():
+            while await reader.read(4096):
+                pass
+
+        await self._attach(Viewer(writer, length_prefixed, self.max_queue), read_until_closed())
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1] if len(lines[0].split(" ")) > 1 else "/"
+        headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:] if line)}
+
+        if headers.get("upgrade", "").lower() == "websocket":
+            accept = base64.b64encode(
+                hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()
+            ).decode()
+            writer.write(
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+            )
+            await self._attach(Viewer(writer, websocket_frame, self.max_queue), self._read_websocket(reader))
+            return
+
+        if path in ("/", "/index.html"):
+            with open(VIEWER_HTML, "rb") as f:
+                body = f.read()
+            status, content_type = "200 OK", "text/html; charset=utf-8"
+        else:
+            body, status, content_type = b"not found", "404 Not Found", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        writer.close()
+
+    @staticmethod
+    async def _read_websocket(reader):
+        """Discard client frames until the client closes the connection."""
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                opcode, length = head[0] & 0x0F, head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack(">H", await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack(">Q", await reader.readexactly(8))[0]
+                if head[1] & 0x80:
+                    await reader.readexactly(4)  # masking key
+                await reader.readexactly(length)
+                if opcode == 0x8:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+class FrameClient:
+    """Plain TCP viewer that rebuilds the grid from keyframes and deltas."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.grid = None
+        self.generation = None
+        self.palette = None
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def read_message(self) -> bytes:
+        (length,) = struct.unpack("<I", await self.reader.readexactly(4))
+        return await self.reader.readexactly(length)
+
+    async def receive(self):
+        """Wait for the next generation and return (generation, grid)."""
+        while True:
+            message = await self.read_message()
+            kind = message[:1]
+            if kind == b"H":
+                rows, cols, itemsize, num_states = struct.unpack_from("<HHBH", message, 1)
+                self.dtype = np.dtype("<u1") if itemsize == 1 else np.dtype("<u2")
+                self.shape = (rows, cols)
+                self.palette = np.frombuffer(message, dtype=np.uint8, offset=8).reshape(num_states, 3)
+            elif kind == b"K":
+                (self.generation,) = struct.unpack_from("<I", message, 1)
+                self.grid = np.frombuffer(message, dtype=self.dtype, offset=5).reshape(self.shape).copy()
+                return self.generation, self.grid
+            elif kind == b"D":
+                self.generation, count = struct.unpack_from("<II", message, 1)
+                indices = np.frombuffer(message, dtype="<u4", count=count, offset=9)
+                states = np.frombuffer(message, dtype=self.dtype, count=count, offset=9 + 4 * count)
+                self.grid.ravel()[indices] = states
+                return self.generation, self.grid
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+if __name__ == "__main__":
+    # loopback check: a fast and a stalled viewer against a recorded run
+    from cellularautomata.ca import CellularAutomata
+    from cellularautomata.rules2 import RainbowLife2
+
+    async def follow(client, timeout=1.0):
+        """Read until the stream goes quiet, checking every generation against the recorded run."""
+        generation = None
+        while True:
+            try:
+                generation, grid = await asyncio.wait_for(client.receive(), timeout)
+            except asyncio.TimeoutError:
+                return generation
+            assert np.array_equal(grid, history[generation]), f"viewer diverged at generation {generation}"
+
+    async def check():
+        rules = RainbowLife2(seed=0, num_states=4, equality_threshold=1)
+        ca = CellularAutomata(300, 300, rules, init_mode="random")
+        update = ca.update
+
+        def recording_update():
+            changed = update()
+            history[len(history)] = ca.grid.copy()
+            return changed
+
+        history[0] = ca.grid.copy()
+        ca.update = recording_update
+        server = FrameServer(ca, port=0, http_port=None, max_queue=2)
+        await server.start()
+        host, port = server.addresses[0]
+        fast = await FrameClient.connect(host, port)
+        slow = await FrameClient.connect(host, port)
+        await asyncio.sleep(0.05)
+        following = asyncio.create_task(follow(fast))
+        await server.run(generations=300)
+        assert await following == server.generation
+        # the stalled viewer only starts reading now and must still end on the last generation
+        dropped = max(viewer.dropped for viewer in server.viewers)
+        assert await follow(slow) == server.generation
+        print(f"{server.generation} generations streamed, the stalled viewer dropped {dropped} frames")
+        await fast.close()
+        await slow.close()
+        await server.close()
+
+    history = {}
+    asyncio.run(check())
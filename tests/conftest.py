@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_dir(tmp_path_factory):
+    """Keep compiled tables out of the developer's ~/.cache, in this process and the workers it starts."""
+    mp = pytest.MonkeyPatch()
+    directory = tmp_path_factory.mktemp("cache")
+    mp.setenv("CELLULARAUTOMATA_CACHE_DIR", str(directory))
+    yield directory
+    mp.undo()
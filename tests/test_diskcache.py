@@ -0,0 +1,65 @@
+import os
+import numpy as np
+
+from cellularautomata import diskcache
+from cellularautomata.ca import CellularAutomata
+from cellularautomata.diskcache import DiskCache, default_cache
+from cellularautomata.rules2 import RainbowLife2
+
+
+def test_miss_then_hit(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = cache.key("table", n=3)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(5)
+
+    first = cache.get(key, compute)
+    second = cache.get(key, compute)
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap)
+    assert np.array_equal(first, second)
+    assert cache.key("table", n=4) != key
+
+
+def test_other_versions_are_invalidated(tmp_path, monkeypatch):
+    old = DiskCache(str(tmp_path))
+    key = old.key("table", n=3)
+    old.save(key, np.arange(5))
+    monkeypatch.setattr(diskcache, "CACHE_VERSION", diskcache.CACHE_VERSION + 1)
+    new = DiskCache(str(tmp_path))
+    # the version is part of the key and of the directory
+    assert new.key("table", n=3) != key
+    assert new.load(key) is None
+    new.save(new.key("table", n=3), np.arange(5))
+    assert not os.path.exists(old.directory)
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10**9)
+    keys = [cache.key("table", n=n) for n in range(3)]
+    for age, key in enumerate(keys):
+        cache.save(key, np.zeros(100))
+        os.utime(cache.path(key), (1000 + age, 1000 + age))
+    # reading the oldest makes it the most recently used
+    assert cache.load(keys[0]) is not None
+    entry_size = os.path.getsize(cache.path(keys[0]))
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert cache.load(keys[1]) is None
+    assert cache.load(keys[0]) is not None and cache.load(keys[2]) is not None
+    assert cache.total == 2 * entry_size
+
+
+def test_editing_the_rules_rebuilds_the_table(monkeypatch):
+    def run():
+        ca = CellularAutomata(20, 20, RainbowLife2(seed=0, num_states=3), init_mode="random")
+        ca.update()
+        return ca.grid.copy()
+
+    run()
+    assert default_cache().entries(), "the table was not cached"
+    monkeypatch.setattr(RainbowLife2, "get_next_state", lambda self, state, neighbors: 0)
+    assert (run() == 0).all()
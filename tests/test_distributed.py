@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from cellularautomata.ca import CellularAutomata
+from cellularautomata.distributed import DistributedCellularAutomata
+from cellularautomata.rules2 import LargerThanLife, RainbowLife2, TripleLife
+
+CASES = {
+    "rainbow": (lambda: RainbowLife2(seed=0, num_states=50, equality_threshold=3), (24, 30), 30),
+    "triple": (lambda: TripleLife(), (40, 33), 30),
+    "radius-3": (lambda: LargerThanLife(radius=3, birth=(9, 15), survival=(8, 20), seed=0), (48, 50), 30),
+    # settles on a still life after a few generations, part way through a batch of 3
+    "fixed-point": (lambda: LargerThanLife(radius=1, birth=(4, 5), survival=(3, 3), seed=0), (24, 30), 60),
+}
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+@pytest.mark.parametrize("case", list(CASES))
+def test_matches_single_process_engine(case, workers):
+    make_rules, (rows, cols), generations = CASES[case]
+    decimation = 3
+    rules = make_rules()
+    single = CellularAutomata(rows, cols, rules, init_mode="random")
+    with DistributedCellularAutomata(rows, cols, rules, workers=workers, decimation=decimation,
+                                     init_mode="random") as distributed:
+        assert np.array_equal(single.grid, distributed.grid)
+        for _ in range(generations // decimation):
+            running = distributed.update()
+            single_running = all(single.update() for _ in range(decimation))
+            assert running == single_running
+            assert np.array_equal(single.grid, distributed.grid), f"diverged at generation {distributed.generation}"
+            if not running:
+                break
+    if case == "fixed-point":
+        assert not running, "the fixed-point case did not reach a fixed point"
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from cellularautomata.ca import CellularAutomata, CellularAutomataMP
+from cellularautomata.kernel import HAVE_NUMBA, Kernel
+from cellularautomata.rules2 import RainbowLife3, rainbow_life3_kernel, rainbow_life3_kernel_vectorized
+
+ROOT = Path(__file__).resolve().parents[1]
+
+AFTER_KERNEL = textwrap.dedent("""
+    from cellularautomata.ca import CellularAutomata, CellularAutomataMP
+    from cellularautomata.distributed import DistributedCellularAutomata
+    from cellularautomata.rules2 import RainbowLife3
+
+    if __name__ == "__main__":
+        rules = RainbowLife3(seed=0, num_states=50, equality_threshold=3)
+        # starts the kernel's thread pool when numba is installed
+        CellularAutomata(20, 20, rules, init_mode="random").update()
+        with CellularAutomataMP(20, 20, rules, processes=2, init_mode="random") as ca:
+            ca.update()
+        with DistributedCellularAutomata(20, 20, rules, workers=2, init_mode="random") as ca:
+            ca.update()
+""")
+
+
+def test_workers_start_after_the_kernel_has_run(tmp_path):
+    script = tmp_path / "after_kernel.py"
+    script.write_text(AFTER_KERNEL)
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    # forked workers used to hang at exit here
+    result = subprocess.run([sys.executable, str(script)], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+
+
+BACKENDS = {
+    "python": lambda: Kernel(rainbow_life3_kernel, jit=False),
+    "vectorized": lambda: Kernel(rainbow_life3_kernel, jit=False, vectorized=rainbow_life3_kernel_vectorized),
+    "jit": lambda: Kernel(rainbow_life3_kernel, jit=True),
+}
+"""The ways of running the RainbowLife3 kernel, all of which must agree."""
+
+
+def backends():
+    return [pytest.param(name, marks=pytest.mark.skipif(name == "jit" and not HAVE_NUMBA, reason="needs numba"))
+            for name in BACKENDS]
+
+
+@pytest.mark.parametrize("backend", backends())
+@pytest.mark.parametrize("equality_threshold", [0, 1, 3])
+def test_kernel_backends_agree(backend, equality_threshold):
+    rng = np.random.default_rng(0)
+    num_states = 12
+    states = rng.integers(num_states, size=5000)
+    neighborhoods = rng.integers(num_states, size=(5000, 8))
+    # cells equal to all and to none of their neighbors
+    neighborhoods[:100] = states[:100, None]
+    neighborhoods[100:200] = (states[100:200, None] + num_states // 2) % num_states
+    rand = rng.random(5000)
+    params = (num_states, equality_threshold)
+    expected = [rainbow_life3_kernel(s, n, r, np.array(params, dtype=np.float64))
+                for s, n, r in zip(states, neighborhoods, rand)]
+    assert np.array_equal(BACKENDS[backend]()(states, neighborhoods, rand, params), expected)
+
+
+def run(engine, generations=20):
+    grids = [engine.grid.copy()]
+    for _ in range(generations):
+        engine.update()
+        grids.append(engine.grid.copy())
+    return np.array(grids)
+
+
+@pytest.fixture(scope="module")
+def per_cell_grids():
+    rules = RainbowLife3(seed=0, num_states=50, equality_threshold=3)
+    rules.kernel = BACKENDS["python"]()
+    engine = CellularAutomata(24, 30, rules, init_mode="random")
+    engine.gathered = False
+    return run(engine)
+
+
+@pytest.mark.parametrize("backend", backends())
+def test_engine_backends_match_the_per_cell_path(backend, per_cell_grids):
+    rules = RainbowLife3(seed=0, num_states=50, equality_threshold=3)
+    rules.kernel = BACKENDS[backend]()
+    assert np.array_equal(run(CellularAutomata(24, 30, rules, init_mode="random")), per_cell_grids)
+
+
+def test_multiprocessing_engine_matches_the_per_cell_path(per_cell_grids):
+    rules = RainbowLife3(seed=0, num_states=50, equality_threshold=3)
+    with CellularAutomataMP(24, 30, rules, processes=3, init_mode="random") as engine:
+        assert np.array_equal(run(engine), per_cell_grids)
@@ -0,0 +1,86 @@
+import asyncio
+import numpy as np
+import pytest
+
+from cellularautomata.ca import CellularAutomata
+from cellularautomata.rules2 import RainbowLife2
+from cellularautomata.stream import FrameClient, FrameServer
+
+
+def make_ca():
+    # the rules seed the global random state, so equal seeds give equal runs
+    rules = RainbowLife2(seed=0, num_states=4, equality_threshold=1)
+    return CellularAutomata(40, 40, rules, init_mode="random")
+
+
+async def receive_all(client, timeout=1.0) -> dict:
+    """Grids reconstructed by the client, by generation, until the stream goes quiet."""
+    frames = {}
+    while True:
+        try:
+            generation, grid = await asyncio.wait_for(client.receive(), timeout)
+        except asyncio.TimeoutError:
+            return frames
+        frames[generation] = grid.copy()
+
+
+def stream(generations, keyframe_interval, max_queue=64):
+    async def run():
+        server = FrameServer(make_ca(), port=0, http_port=None, max_queue=max_queue,
+                             keyframe_interval=keyframe_interval)
+        await server.start()
+        client = await FrameClient.connect(*server.addresses[0])
+        try:
+            # let the server register the viewer before the first frame is published
+            await asyncio.sleep(0.05)
+            receiving = asyncio.create_task(receive_all(client))
+            await server.run(generations=generations)
+            return await receiving, server.generation
+        finally:
+            await client.close()
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_reconstructed_frames_match_iter_generations():
+    expected = [grid.copy() for grid in make_ca().iter_generations(30)]
+    frames, last = stream(30, keyframe_interval=10)
+    assert last == len(expected) - 1
+    assert sorted(frames) == list(range(len(expected)))
+    for generation, grid in frames.items():
+        assert np.array_equal(grid, expected[generation]), f"viewer diverged at generation {generation}"
+
+
+def test_deltas_only_after_the_first_keyframe():
+    # with no periodic keyframes every generation after the first is rebuilt from deltas
+    expected = [grid.copy() for grid in make_ca().iter_generations(15)]
+    frames, _ = stream(15, keyframe_interval=10**6)
+    assert len(frames) == len(expected)
+    for generation, grid in frames.items():
+        assert np.array_equal(grid, expected[generation])
+
+
+def test_late_viewer_with_a_queue_of_one():
+    async def run():
+        server = FrameServer(make_ca(), port=0, http_port=None, max_queue=1)
+        await server.start()
+        try:
+            # publishes generation 0, so the viewer connects after the first frame
+            await server.run(generations=3)
+            client = await FrameClient.connect(*server.addresses[0])
+            generation, grid = await asyncio.wait_for(client.receive(), 1.0)
+            assert generation == server.generation
+            assert np.array_equal(grid, server.latest)
+            assert len(server.viewers) == 1
+            await client.close()
+        finally:
+            await server.close()
+        assert not server.viewers and not server.handlers
+
+    asyncio.run(run())
+
+
+def test_max_queue_must_be_positive():
+    with pytest.raises(ValueError):
+        FrameServer(make_ca(), port=0, http_port=None, max_queue=0)